@@ -0,0 +1,110 @@
+import numpy as np
+from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
+from eeg_replay import ReplayBoard
+
+"""
+Shared BrainFlow acquisition helpers.
+
+get_current_board_data(n) only peeks at the newest n samples and leaves the
+ring buffer alone, so polling it with n=1 every 0.1 s skips almost everything
+the Ganglion sends at 200 Hz. get_board_data() removes and returns everything
+collected since the last call, so draining it at any poll interval keeps
+every sample as long as the buffer does not overflow between polls.
+"""
+
+#found with s0EEG_board_mac_finder.py
+GANGLION_MAC_ADDRESS = "D5:A4:BE:DD:BC:89"
+GANGLION_SERIAL_PORT = "COM5"
+
+#the package number counts up once per radio packet and wraps around.
+#Ganglion cycles through 100 ids (101-200 or 1-100 depending on compression),
+#the synthetic board and most others wrap at 256.
+PACKAGE_NUM_WRAP = {
+    BoardIds.GANGLION_BOARD.value: 100,
+    BoardIds.GANGLION_NATIVE_BOARD.value: 100,
+}
+DEFAULT_PACKAGE_NUM_WRAP = 256
+
+
+def create_board(synthetic=False, replay=None, speed=1.0, mac_address=GANGLION_MAC_ADDRESS, serial_port=GANGLION_SERIAL_PORT, instance=None):
+    """
+    Build a BoardShim for the Ganglion, or for BrainFlow's synthetic board
+    so the pipeline can be exercised without hardware, or a ReplayBoard that
+    streams a recorded session at speed times real time.
+    serial_port=None connects over the computer's own Bluetooth (no dongle),
+    which is how several Ganglions are run from one machine.
+    instance tells apart several synthetic boards in one process, BrainFlow
+    refuses two boards with identical parameters.
+    Returns (board, board_id).
+    """
+    if replay:
+        board = ReplayBoard(replay, speed=speed)
+        return board, board.board_id
+
+    params = BrainFlowInputParams()
+    if instance is not None:
+        params.other_info = str(instance)
+    if synthetic:
+        board_id = BoardIds.SYNTHETIC_BOARD.value
+    elif serial_port is None:
+        board_id = BoardIds.GANGLION_NATIVE_BOARD.value
+        params.mac_address = mac_address
+    else:
+        board_id = BoardIds.GANGLION_BOARD.value
+        params.mac_address = mac_address
+        params.serial_port = serial_port
+    return BoardShim(board_id, params), board_id
+
+
+def count_dropped_packets(package_nums, previous=None, wrap=DEFAULT_PACKAGE_NUM_WRAP):
+    """
+    Count missing packets in a run of package numbers.
+    A step of 0 (several samples decoded from one packet) or 1 is normal,
+    anything larger means step - 1 packets never arrived.
+    previous is the last package number of the previous block so drops
+    across block boundaries are counted too.
+    """
+    package_nums = np.asarray(package_nums, dtype=np.int64)
+    if previous is not None:
+        package_nums = np.concatenate(([int(previous)], package_nums))
+    if package_nums.size < 2:
+        return 0
+    steps = np.diff(package_nums) % wrap
+    return int(np.sum(steps[steps > 1] - 1))
+
+
+class BlockReader:
+    """
+    Drains the board's ring buffer in blocks and keeps running counters of
+    samples read and packets dropped.
+    """
+
+    def __init__(self, board, board_id):
+        self.board = board
+        self.board_id = board_id
+        self.fs = BoardShim.get_sampling_rate(board_id)
+        self.package_channel = BoardShim.get_package_num_channel(board_id)
+        self.timestamp_channel = BoardShim.get_timestamp_channel(board_id)
+        self.eeg_channels = BoardShim.get_eeg_channels(board_id)
+        self.wrap = PACKAGE_NUM_WRAP.get(board_id, DEFAULT_PACKAGE_NUM_WRAP)
+        self.samples_read = 0
+        self.dropped_packets = 0
+        self.last_package = None
+
+    def read(self):
+        """
+        Return every sample collected since the last call, shape (num_rows, n).
+        n can be 0 if nothing new has arrived yet.
+        """
+        block = self.board.get_board_data()
+        if block.shape[1] == 0:
+            return block
+
+        package_nums = block[self.package_channel]
+        self.dropped_packets += count_dropped_packets(package_nums, self.last_package, self.wrap)
+        self.last_package = package_nums[-1]
+        self.samples_read += block.shape[1]
+        return block
+
+    def summary(self):
+        return f"{self.samples_read} samples read, {self.dropped_packets} packets dropped"
@@ -0,0 +1,251 @@
+import json
+import os
+import shutil
+import numpy as np
+import joblib
+from eeg_features import RollingFeatures, extract_features
+from eeg_filters import FilterBank, StreamingDecimator
+
+"""
+A model bundle is a directory the trainers write and the live scripts load:
+
+    lda_bundle/
+        bundle.json     everything needed to feed the model live
+        model.joblib    (LDA/SVM)  or  model.h5 + model.tflite (CNN)
+
+bundle.json holds the label order of the model's outputs, the fs it was
+trained at, which filtered channels it uses (and so which of the board's
+EEG channels), the window length and hop, the filter s3 applied, and the
+feature config for feature-based models. The live scripts read all of that
+from the bundle instead of hardcoding it. A bundle trained at a lower rate
+than the board (s3 --fs) runs on the board's stream decimated to its fs.
+
+Loading is lazy: TensorFlow is only imported for a Keras model without a
+TFLite export, joblib models never touch it. load_bundle() runs one
+prediction on a blank window so the first live prediction isn't slowed by
+first-call setup.
+
+The model files saved before bundles existed (lda_model.joblib,
+EEG_CNN_model.h5) are converted the first time lda_bundle or cnn_bundle is
+asked for and isn't there, see convert_legacy().
+"""
+
+BUNDLE_FORMAT = 1
+
+# What s3 does when filtered_eeg_action_data.json isn't there (files filtered before it was written)
+DEFAULT_PREPROCESSING = {'fs': 200, 'band': [0.5, 50], 'order': 4, 'notch_freq': None, 'causal': False}
+
+
+def preprocessing_path(filtered_csv):
+    return os.path.splitext(filtered_csv)[0] + '.json'
+
+
+def read_preprocessing(filtered_csv='filtered_eeg_action_data.csv'):
+    """The filter settings s3 saved next to its output."""
+    path = preprocessing_path(filtered_csv)
+    if not os.path.exists(path):
+        return dict(DEFAULT_PREPROCESSING)
+    with open(path) as file:
+        return dict(DEFAULT_PREPROCESSING, **json.load(file))
+
+
+def board_channel(column):
+    """'Filtered Channel 2' -> 1, the position among the board's EEG channels."""
+    return int(column.rsplit(' ', 1)[1]) - 1
+
+
+def save_bundle(path, model, labels, channels, fs, window_seconds, hop_seconds, preprocessing,
+                feature_config=None, tflite_model=None, extra=None):
+    """
+    Write a bundle directory. model is a fitted sklearn-style classifier
+    (saved with joblib) or a Keras model (saved as .h5, plus tflite_model
+    bytes if given). labels is the class name of each model output, in order.
+    """
+    os.makedirs(path, exist_ok=True)
+    keras_model = hasattr(model, 'save')
+    if keras_model:
+        model.save(os.path.join(path, 'model.h5'))
+        model_file = 'model.h5'
+    else:
+        joblib.dump(model, os.path.join(path, 'model.joblib'))
+        model_file = 'model.joblib'
+    if tflite_model is not None:
+        with open(os.path.join(path, 'model.tflite'), 'wb') as file:
+            file.write(tflite_model)
+    write_config(path, 'keras' if keras_model else 'sklearn', model_file, 'model.tflite' if tflite_model is not None else None,
+                 labels, channels, fs, window_seconds, hop_seconds, preprocessing, feature_config, extra)
+
+
+def write_config(path, kind, model_file, tflite_file, labels, channels, fs, window_seconds, hop_seconds, preprocessing,
+                 feature_config=None, extra=None):
+    """Write bundle.json for a model file already in the bundle directory."""
+    config = {
+        'format': BUNDLE_FORMAT,
+        'kind': kind,
+        'model_file': model_file,
+        'tflite_file': tflite_file,
+        'labels': [str(label) for label in labels],
+        'fs': float(fs),
+        'channels': list(channels),
+        'board_channels': [board_channel(column) for column in channels],
+        'window_seconds': float(window_seconds),
+        'window_samples': int(window_seconds * fs),
+        'hop_seconds': float(hop_seconds),
+        'preprocessing': preprocessing,
+        'feature_config': feature_config,
+    }
+    config.update(extra or {})
+    tmp_path = os.path.join(path, 'bundle.json.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump(config, file, indent=2)
+    os.replace(tmp_path, os.path.join(path, 'bundle.json'))
+    print(f"Model bundle saved to '{path}'")
+
+
+class Bundle:
+    """A loaded bundle: its config as attributes plus predict/predict_proba on filtered windows."""
+
+    def __init__(self, path, prefer_tflite=True):
+        with open(os.path.join(path, 'bundle.json')) as file:
+            self.config = json.load(file)
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self.labels = np.array(self.config['labels'])
+        self.fs = self.config['fs']
+        self.board_channels = self.config['board_channels']
+        self.window_samples = self.config['window_samples']
+        self.hop_samples = max(1, int(round(self.config['hop_seconds'] * self.fs)))
+        self.preprocessing = self.config['preprocessing']
+        self.causal = bool(self.preprocessing.get('causal', False))  # s3 --causal, the filter the live scripts run
+        self.feature_config = self.config['feature_config']
+        self.model = self.load_model(prefer_tflite)
+
+    def load_model(self, prefer_tflite):
+        if self.config['kind'] == 'sklearn':
+            return joblib.load(os.path.join(self.path, self.config['model_file']))
+        tflite_file = self.config.get('tflite_file')
+        if prefer_tflite and tflite_file and os.path.exists(os.path.join(self.path, tflite_file)):
+            from eeg_inference import TFLiteModel
+            return TFLiteModel(os.path.join(self.path, tflite_file))
+        import tensorflow as tf
+        return tf.keras.models.load_model(os.path.join(self.path, self.config['model_file']))
+
+    def decimation(self, board_fs):
+        """How many board samples make one bundle sample, e.g. 2 for a 100 Hz bundle on the 200 Hz Ganglion."""
+        factor = board_fs / self.fs
+        if factor < 1 - 1e-6 or abs(factor - round(factor)) > 1e-6:
+            raise ValueError(f"Bundle '{self.name}' was trained at {self.fs} Hz, the board's {board_fs} Hz "
+                             f"can't be decimated to it")
+        return int(round(factor))
+
+    def check_board(self, board_fs):
+        self.decimation(board_fs)
+
+    def decimator(self, board_fs):
+        """The causal anti-aliasing decimator from the board's rate to the bundle's, None when they match."""
+        factor = self.decimation(board_fs)
+        return StreamingDecimator(factor) if factor > 1 else None
+
+    def filter_bank(self):
+        """The bandpass s3 used for the training data, to stream over live data (zero-phase unless self.causal)."""
+        settings = self.preprocessing
+        return FilterBank(self.fs, tuple(settings['band']), order=settings['order'], notch_freq=settings['notch_freq'])
+
+    def rolling_features(self):
+        """A RollingFeatures that keeps this bundle's features up to date (feature-based bundles only)."""
+        return RollingFeatures(self.window_samples, len(self.board_channels), self.fs, self.feature_config)
+
+    def features(self, window):
+        """Feature vector (1, features) of one filtered (samples, board EEG channels) window."""
+        return extract_features(window[np.newaxis, -self.window_samples:, self.board_channels], self.fs, self.feature_config)
+
+    def predict_proba_features(self, features):
+        """Class probabilities, in label order, from a (1, features) vector."""
+        if hasattr(self.model, 'predict_proba'):
+            return self.model.predict_proba(features)[0]
+        # classifiers without probabilities get all their weight on the predicted class
+        return np.eye(len(self.labels))[self.model.predict(features)[0]]
+
+    def predict_proba(self, window):
+        """Class probabilities, in label order, for the latest window_samples of a filtered window."""
+        if self.feature_config is not None:
+            return self.predict_proba_features(self.features(window))
+        epoch = window[np.newaxis, -self.window_samples:, self.board_channels, np.newaxis]
+        return np.asarray(self.model.predict(epoch.astype(np.float32), verbose=0))[0]
+
+    def predict(self, window):
+        return self.labels[int(np.argmax(self.predict_proba(window)))]
+
+    def warm_up(self):
+        """One prediction on a blank window, so first-call setup happens at load time."""
+        self.predict_proba(np.zeros((self.window_samples, max(self.board_channels) + 1)))
+
+
+def legacy_lda(model_file, path):
+    """
+    Bundle for an lda_model.joblib from the old s52: mean and std (like
+    pandas, ddof=1) of 2 s windows of 'Filtered Channel 2' and 4, stored
+    per channel as mean, std, mean, std. extract_features() gives all means
+    then all stds, so a ColumnTransformer puts them back in the old order.
+    """
+    from sklearn.compose import ColumnTransformer
+    from sklearn.pipeline import Pipeline
+    saved = joblib.load(model_file)
+    lda, label_encoder = saved['model'], saved['label_encoder']
+    reorder = ColumnTransformer([('old_order', 'passthrough', [0, 2, 1, 3])]).fit(np.zeros((1, 4)))
+    model = Pipeline([('reorder', reorder), ('lda', lda)])
+    feature_config = {'stats': True, 'ddof': 1, 'bands': {}, 'hjorth': False, 'ptp': False, 'covariance': False}
+    save_bundle(path, model, label_encoder.inverse_transform(lda.classes_), ['Filtered Channel 2', 'Filtered Channel 4'],
+                200, 2.0, 2.0, dict(DEFAULT_PREPROCESSING), feature_config, extra={'converted_from': model_file})
+
+
+def legacy_cnn(model_file, path):
+    """
+    Bundle for an EEG_CNN_model.h5 from the old s5: the first 14 samples of
+    an epoch of all four filtered channels, unscaled, and its classes in
+    sorted order (np.unique of the recording's five labels at the time).
+    The .h5 is copied as is, so TensorFlow is only needed to run it.
+    """
+    os.makedirs(path, exist_ok=True)
+    shutil.copyfile(model_file, os.path.join(path, 'model.h5'))
+    labels = ['both_blink', 'eyebrow_raise', 'left_blink', 'nothing', 'right_blink']
+    channels = [f'Filtered Channel {channel}' for channel in range(1, 5)]
+    write_config(path, 'keras', 'model.h5', None, labels, channels, 200, 14 / 200, 2.0, dict(DEFAULT_PREPROCESSING),
+                 extra={'converted_from': model_file})
+
+
+# Bundle directory name -> (model file saved before bundles, its converter)
+LEGACY_MODELS = {
+    'lda_bundle': ('lda_model.joblib', legacy_lda),
+    'cnn_bundle': ('EEG_CNN_model.h5', legacy_cnn),
+}
+
+
+def convert_legacy(path):
+    """Convert the old model file a missing bundle directory stands for. False if there's none."""
+    model_file, convert = LEGACY_MODELS.get(os.path.basename(os.path.normpath(path)), (None, None))
+    model_file = model_file and os.path.join(os.path.dirname(os.path.normpath(path)), model_file)
+    if model_file is None or not os.path.exists(model_file):
+        return False
+    print(f"No bundle at '{path}', converting '{model_file}' from before bundles existed")
+    convert(model_file, path)
+    return True
+
+
+def bundle_available(path):
+    """True if path is a bundle, or a legacy model file can be converted into one."""
+    if os.path.exists(os.path.join(path, 'bundle.json')):
+        return True
+    model_file, _ = LEGACY_MODELS.get(os.path.basename(os.path.normpath(path)), (None, None))
+    return model_file is not None and os.path.exists(os.path.join(os.path.dirname(os.path.normpath(path)), model_file))
+
+
+def load_bundle(path, prefer_tflite=True, warm_up=True):
+    if not os.path.exists(os.path.join(path, 'bundle.json')) and not convert_legacy(path):
+        raise FileNotFoundError(f"No model bundle at '{path}', train one first (s52/s53/s54 or s5)")
+    bundle = Bundle(path, prefer_tflite)
+    if warm_up:
+        bundle.warm_up()
+    print(f"Loaded model bundle '{path}': {bundle.config['kind']} model, labels {bundle.config['labels']}, "
+          f"{bundle.config['window_seconds']} s windows at {bundle.fs} Hz, channels {bundle.config['channels']}")
+    return bundle
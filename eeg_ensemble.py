@@ -0,0 +1,148 @@
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from eeg_live import LATENCY_HISTORY, SlidingClassifier
+from eeg_metrics import NULL_METRICS
+
+"""
+Several model bundles classifying the same live windows, combined into one
+decision.
+
+EnsembleClassifier has the windows()/predict_payload()/labels interface of
+SlidingClassifier, so LiveEngine runs it like a single model:
+
+- Each raw block is decimated once (the bundles must share one fs) and
+  filtered once per distinct filter setting in the bundles' preprocessing
+  (usually one for all of them), not once per model. Every member then
+  buffers the filtered block and updates its own features.
+- Members start at the longest window and share the hop, so they all cut a
+  window at the same sample.
+- Keras/TFLite members predict on a thread pool, since their inference
+  releases the GIL and can overlap with the rest. Feature members (LDA,
+  SVM) run on the calling thread one after another meanwhile: their
+  predictions are short sklearn/numpy calls that hold the GIL, so a worker
+  thread only adds handoff time. An ensemble with a CNN takes about as long
+  as its slowest member. An ensemble of feature models only takes about
+  the sum of them, and each is well under a millisecond.
+- Probabilities are matched up by label name, since bundles may order or
+  even cover their labels differently. 'soft' voting averages them with
+  the given weights. 'hard' voting gives each member its weight on its own
+  top label.
+"""
+
+
+class EnsembleClassifier:
+    def __init__(self, bundles, board_id, hop_samples, weights=None, voting='soft', metrics=NULL_METRICS):
+        if voting not in ('soft', 'hard'):
+            raise ValueError(f"voting must be 'soft' or 'hard', not {voting!r}")
+        rates = {bundle.fs for bundle in bundles}
+        if len(rates) > 1:
+            raise ValueError(f"Ensemble bundles must share one fs, got {sorted(rates)} Hz")
+        self.members = [SlidingClassifier(bundle, board_id, hop_samples) for bundle in bundles]
+        self.names = [bundle.name for bundle in bundles]
+        self.weights = np.ones(len(bundles)) if weights is None else np.asarray(weights, dtype=float)
+        if len(self.weights) != len(bundles):
+            raise ValueError(f"{len(bundles)} bundles but {len(self.weights)} weights")
+        self.voting = voting
+        self.metrics = metrics
+        self.hop_samples = hop_samples
+
+        # Labels of every member, in order of first appearance, and where each member's outputs go
+        labels = []
+        for bundle in bundles:
+            labels += [label for label in bundle.labels if label not in labels]
+        self.labels = np.array(labels)
+        self.columns = [np.array([labels.index(label) for label in bundle.labels]) for bundle in bundles]
+
+        # One streaming filter per distinct preprocessing, shared by the members that use it
+        self.filters = {}
+        self.filter_of = []
+        for member in self.members:
+            key = json.dumps(member.bundle.preprocessing, sort_keys=True)
+            if key not in self.filters:
+                self.filters[key] = member.stream_filter
+            self.filter_of.append(key)
+
+        # Every member decides at the same samples: after the longest window, then every hop
+        first_end = max(member.next_end for member in self.members)
+        for member in self.members:
+            member.next_end = first_end
+        self.feature_time = 0.0
+
+        # Only models that release the GIL gain anything from a thread, the rest run inline
+        self.pooled = [index for index, bundle in enumerate(bundles) if bundle.config['kind'] == 'keras']
+        self.inline = [index for index in range(len(bundles)) if index not in self.pooled]
+        if not self.inline:
+            self.inline.append(self.pooled.pop())  # the calling thread would otherwise only wait
+        self.pool = ThreadPoolExecutor(max_workers=len(self.pooled), thread_name_prefix='ensemble') if self.pooled else None
+        self.member_latencies = [deque(maxlen=LATENCY_HISTORY) for _ in self.members]
+        self.latencies = deque(maxlen=LATENCY_HISTORY)  # whole ensemble decisions
+
+    def windows(self, data, copy=False):
+        """Like SlidingClassifier.windows(), with a tuple holding every member's payload."""
+        t0 = time.perf_counter()
+        eeg, timestamps = self.members[0].board_block(data)  # decimated once for everyone, they share one fs
+        filtered = {key: stream_filter.process(eeg) for key, stream_filter in self.filters.items()}
+        self.metrics.observe('filter', time.perf_counter() - t0)
+        generators = [member.filtered_windows(filtered[key], timestamps, copy)
+                      for member, key in zip(self.members, self.filter_of)]
+        while True:
+            t0 = time.perf_counter()
+            # every generator is advanced even after one runs out, so all of them buffer the block's tail
+            items = [next(generator, None) for generator in generators]
+            if items[0] is None:
+                self.feature_time += time.perf_counter() - t0
+                return
+            self.metrics.observe('features', self.feature_time + time.perf_counter() - t0)
+            self.feature_time = 0.0
+            end, _, sample_time = items[0]
+            yield end, tuple(payload for _, payload, _ in items), sample_time
+
+    def timed_predict(self, index, payload):
+        t0 = time.perf_counter()
+        probabilities = self.members[index].predict_payload(payload)
+        latency = time.perf_counter() - t0
+        self.member_latencies[index].append(latency)
+        self.metrics.observe(f"predict_{self.names[index]}", latency)
+        return probabilities
+
+    def predict_payload(self, payloads):
+        """Combined class probabilities, in self.labels order, for one tuple from windows()."""
+        t0 = time.perf_counter()
+        # the pooled members start first, so they run while the inline ones take their turns
+        futures = {index: self.pool.submit(self.timed_predict, index, payloads[index]) for index in self.pooled}
+        if futures:
+            # let the workers take the GIL up to their model's GIL-free call, else they'd wait for the inline members
+            time.sleep(0)
+        outputs = {index: self.timed_predict(index, payloads[index]) for index in self.inline}
+        outputs.update({index: future.result() for index, future in futures.items()})
+        combined = self.combine([outputs[index] for index in range(len(self.members))])
+        self.latencies.append(time.perf_counter() - t0)
+        return combined
+
+    def combine(self, outputs):
+        combined = np.zeros(len(self.labels))
+        for probabilities, columns, weight in zip(outputs, self.columns, self.weights):
+            probabilities = np.asarray(probabilities, dtype=float)
+            if self.voting == 'hard':
+                combined[columns[np.argmax(probabilities)]] += weight
+            else:
+                combined[columns] += weight * probabilities
+        total = combined.sum()
+        return combined / total if total > 0 else combined
+
+    def print_member_latency(self):
+        """Mean prediction time per member, and the whole ensemble's next to its slowest member and their sum."""
+        means = [1000 * np.mean(latencies) for latencies in self.member_latencies if latencies]
+        if len(means) != len(self.members):
+            return
+        for index, (name, mean) in enumerate(zip(self.names, means)):
+            print(f"  {name:<15} mean {mean:.3f} ms ({'thread pool' if index in self.pooled else 'inline'})")
+        print(f"  ensemble {1000 * np.mean(self.latencies):.3f} ms per decision, slowest member {max(means):.3f} ms, "
+              f"all members in sequence {sum(means):.3f} ms")
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
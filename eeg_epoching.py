@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from eeg_resample import estimate_fs
+
+"""
+Epoching shared by the LDA, SVM and CNN trainers.
+
+Instead of grouping a DataFrame by epoch number and checking every group's
+labels, the recording is kept as one contiguous (samples, channels) array
+and epochs are described by their start sample only:
+
+- label_runs() run-length encodes the label vector (a new run starts
+  whenever the label or the s3 segment changes),
+- window_starts() lays windows of `length` samples every `hop` samples
+  inside each run, so every window has a single label and never spans a
+  gap, all with array operations,
+- window_view() is a zero-copy strided view where view[s] is the window
+  starting at sample s, so nothing is copied until a model needs the data.
+"""
+
+
+def load_signal(path, channel_cols):
+    """
+    Read a filtered CSV from s3 into (signal, label codes, label names, segments, fs).
+    signal is a C-contiguous (samples, channels) array; label names are sorted
+    (the same order as LabelEncoder and np.unique), codes index into them.
+    """
+    data = pd.read_csv(path, usecols=lambda col: col in set(channel_cols) | {'Time', 'Label', 'Segment'})
+    signal = np.ascontiguousarray(data[channel_cols].to_numpy(dtype=float))
+    label_names, codes = np.unique(data['Label'].to_numpy(dtype=str), return_inverse=True)
+    segments = data['Segment'].to_numpy() if 'Segment' in data else None
+    return signal, codes, label_names, segments, estimate_fs(data['Time'])
+
+
+def catalog_sessions(catalog_path='eeg_sessions/catalog.json'):
+    """The session entries of s2's catalog, in combined-file order, or None without one."""
+    if not os.path.exists(catalog_path):
+        return None
+    with open(catalog_path) as file:
+        return json.load(file)['sessions'] or None
+
+
+def session_rows(n_rows, catalog_path='eeg_sessions/catalog.json'):
+    """
+    Which recorded session every row of s2's combined file came from, using
+    the row count s2 stored for each session. None when there is no catalog
+    or it doesn't add up to n_rows (a file combined some other way).
+    """
+    sessions = catalog_sessions(catalog_path)
+    if sessions is None:
+        return None
+    rows = [entry['rows'] for entry in sessions]
+    if sum(rows) != n_rows:
+        return None
+    return np.repeat(np.arange(len(rows)), rows)
+
+
+def session_ids(times, catalog_path='eeg_sessions/catalog.json', tolerance=1.0):
+    """
+    Which recorded session every sample came from, using the time offsets s2
+    stored in its catalog. None when there is no catalog or it doesn't match
+    the times (a stale catalog or a file combined some other way): the
+    recording must end within tolerance seconds of the last session's
+    max_time and every session must have samples. s3 may drop a short
+    segment at either end, hence the tolerance.
+    """
+    sessions = catalog_sessions(catalog_path)
+    if sessions is None:
+        return None
+    times = np.asarray(times, dtype=float)
+    offsets = np.array([entry['time_offset'] for entry in sessions])
+    if np.any(np.diff(offsets) < 0) or abs(times.max() - sessions[-1]['max_time']) > tolerance \
+            or times.min() < offsets[0] - tolerance:
+        return None
+    # the next session starts at the previous one's last time, ties go to the later session
+    ids = np.maximum(np.searchsorted(offsets, times, side='right') - 1, 0)
+    if np.any(np.bincount(ids, minlength=len(offsets)) == 0):
+        return None
+    return ids
+
+
+def label_runs(codes, segments=None):
+    """Run-length encoding: (run starts, run ends (exclusive), run label codes)."""
+    codes = np.asarray(codes)
+    change = codes[1:] != codes[:-1]
+    if segments is not None:
+        segments = np.asarray(segments)
+        change |= segments[1:] != segments[:-1]
+    starts = np.concatenate(([0], np.nonzero(change)[0] + 1))
+    ends = np.concatenate((starts[1:], [len(codes)]))
+    return starts, ends, codes[starts]
+
+
+def window_starts(codes, length, hop=None, segments=None):
+    """
+    Start sample and label code of every window of `length` samples, one
+    every `hop` samples (default: non-overlapping) inside each label run.
+    """
+    hop = hop or length
+    run_starts, run_ends, run_codes = label_runs(codes, segments)
+    counts = np.maximum((run_ends - run_starts - length) // hop + 1, 0)
+    total = counts.sum()
+    # position of each window inside its run: 0, 1, 2, ... restarting at every run
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    within = np.arange(total) - first
+    starts = np.repeat(run_starts, counts) + within * hop
+    return starts, np.repeat(run_codes, counts)
+
+
+def window_view(signal, length):
+    """Zero-copy (samples - length + 1, length, channels) view, view[s] = signal[s:s + length]."""
+    return sliding_window_view(signal, length, axis=0).transpose(0, 2, 1)
+
+
+def run_bounds(codes, starts, segments=None):
+    """Start and end (exclusive) of the label run each window start lies in."""
+    run_starts, run_ends, _ = label_runs(codes, segments)
+    run = np.searchsorted(run_starts, starts, side='right') - 1
+    return run_starts[run], run_ends[run]
+
+
+def cached_signal(signal, cache_dir='features_cache'):
+    """
+    The signal written once to an .npy file (named by its content hash) and
+    opened memory-mapped, so training can slice windows from disk.
+    """
+    path = os.path.join(cache_dir, 'signal_' + hashlib.sha1(np.ascontiguousarray(signal).view(np.uint8)).hexdigest() + '.npy')
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, signal)
+        os.replace(tmp_path, path)
+    return np.load(path, mmap_mode='r')
+
+
+def describe(window_codes, label_names):
+    counts = np.bincount(window_codes, minlength=len(label_names))
+    return ", ".join(f"{name}: {count}" for name, count in zip(label_names, counts))
@@ -0,0 +1,300 @@
+import hashlib
+import json
+import os
+import numpy as np
+from eeg_epoching import window_view
+
+"""
+Features for the LDA/SVM models, computed for a whole batch of windows at
+once. windows is always a (windows, samples, channels) array, e.g. the
+epochs gathered from eeg_epoching.window_view(), or a single live window
+with a leading axis of 1, so training and live prediction share one code
+path and give the same numbers.
+
+Feature groups (each one per channel, in channel order):
+- mean, std: the original LDA features
+- band powers: log10 power in each band from a periodogram of the window
+  (one Hann-windowed segment, mean removed, the single-segment case of Welch)
+- hjorth: activity, mobility, complexity
+- ptp: peak-to-peak amplitude
+- covariance: covariance of every channel pair (upper triangle)
+
+Which groups are used is a small JSON-able config dict, saved with the
+model so the live script computes exactly what it was trained on.
+"""
+
+DEFAULT_BANDS = {
+    'delta': (0.5, 4),
+    'theta': (4, 8),
+    'alpha': (8, 13),
+    'beta': (13, 30),
+    'gamma': (30, 50),
+}
+
+DEFAULT_CONFIG = {
+    'stats': True,
+    'ddof': 1,  # std like pandas, which the trainers used
+    'bands': DEFAULT_BANDS,
+    'hjorth': True,
+    'ptp': True,
+    'covariance': True,
+}
+
+FEATURES_VERSION = 1  # bump when a feature's definition changes, so old cache files aren't reused
+
+
+def hann(length):
+    """Periodic Hann window (what scipy.signal.get_window('hann', n) and Welch use)."""
+    return 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(length) / length)
+
+
+def band_bins(length, fs, bands):
+    """rfft bin ranges [lo, hi) for each band of a window of `length` samples."""
+    freqs = np.fft.rfftfreq(length, 1.0 / fs)
+    return [(int(np.searchsorted(freqs, lo)), int(np.searchsorted(freqs, hi))) for lo, hi in bands.values()]
+
+
+def psd_scale(length, fs):
+    """Per-bin factor turning |rfft|^2 of a Hann-windowed window into a one-sided PSD."""
+    scale = np.full(length // 2 + 1, 2.0 / (fs * np.sum(hann(length) ** 2)))
+    scale[0] /= 2
+    if length % 2 == 0:
+        scale[-1] /= 2
+    return scale
+
+
+def band_powers_from_spectrum(spectrum, length, fs, bands):
+    """log10 band powers from the rfft of demeaned, Hann-windowed windows, (windows, bins, channels)."""
+    psd = np.abs(spectrum) ** 2 * psd_scale(length, fs)[:, np.newaxis]
+    df = fs / length
+    powers = [psd[:, lo:hi].sum(axis=1) * df for lo, hi in band_bins(length, fs, bands)]
+    return [np.log10(np.maximum(power, 1e-20)) for power in powers]
+
+
+def hjorth_from_variances(var_x, var_dx, var_ddx):
+    mobility = np.sqrt(var_dx / np.maximum(var_x, 1e-20))
+    complexity = np.sqrt(var_ddx / np.maximum(var_dx, 1e-20)) / np.maximum(mobility, 1e-20)
+    return [var_x, mobility, complexity]
+
+
+def upper_pairs(n_channels):
+    return np.triu_indices(n_channels, k=1)
+
+
+def feature_names(channels, config):
+    """Column names in the order extract_features() returns them."""
+    names = []
+    if config.get('stats'):
+        names += [f"{kind} {ch}" for kind in ('mean', 'std') for ch in channels]
+    names += [f"{band} power {ch}" for band in config.get('bands', {}) for ch in channels]
+    if config.get('hjorth'):
+        names += [f"hjorth {kind} {ch}" for kind in ('activity', 'mobility', 'complexity') for ch in channels]
+    if config.get('ptp'):
+        names += [f"ptp {ch}" for ch in channels]
+    if config.get('covariance'):
+        rows, cols = upper_pairs(len(channels))
+        names += [f"cov {channels[i]} x {channels[j]}" for i, j in zip(rows, cols)]
+    return names
+
+
+def extract_features(windows, fs, config=DEFAULT_CONFIG):
+    """(windows, samples, channels) -> (windows, features) for every window at once."""
+    windows = np.asarray(windows, dtype=float)
+    length = windows.shape[1]
+    mean = windows.mean(axis=1)
+    centered = windows - mean[:, np.newaxis, :]
+    columns = []
+    if config.get('stats'):
+        columns += [mean, windows.std(axis=1, ddof=config.get('ddof', 1))]
+    if config.get('bands'):
+        spectrum = np.fft.rfft(centered * hann(length)[:, np.newaxis], axis=1)
+        columns += band_powers_from_spectrum(spectrum, length, fs, config['bands'])
+    if config.get('hjorth'):
+        dx = np.diff(windows, axis=1)
+        columns += hjorth_from_variances(centered.var(axis=1), dx.var(axis=1), np.diff(dx, axis=1).var(axis=1))
+    if config.get('ptp'):
+        columns.append(np.ptp(windows, axis=1))
+    if config.get('covariance'):
+        cov = np.einsum('nsi,nsj->nij', centered, centered) / length
+        rows, cols = upper_pairs(windows.shape[2])
+        columns.append(cov[:, rows, cols])
+    return np.column_stack(columns) if columns else np.empty((len(windows), 0))
+
+
+def features_for_starts(view, starts, fs, config=DEFAULT_CONFIG, batch_size=2048):
+    """extract_features() for view[starts], gathering batch_size windows at a time to bound memory."""
+    blocks = [extract_features(view[starts[i:i + batch_size]], fs, config)
+              for i in range(0, len(starts), batch_size)]
+    return np.concatenate(blocks) if blocks else extract_features(view[:0], fs, config)
+
+
+def cache_key(signal, starts, length, fs, config):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(signal).view(np.uint8))
+    digest.update(np.ascontiguousarray(starts, dtype=np.int64).view(np.uint8))
+    digest.update(json.dumps([FEATURES_VERSION, signal.shape, length, fs, config], sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def cache_path(signal, starts, length, fs, config=DEFAULT_CONFIG, cache_dir='features_cache'):
+    return os.path.join(cache_dir, cache_key(signal, starts, length, fs, config) + '.npy')
+
+
+def cached_features(signal, starts, length, fs, config=DEFAULT_CONFIG, cache_dir='features_cache', mmap_mode=None):
+    """
+    Features of the windows signal[s:s + length] for s in starts, loaded from
+    cache_dir when the same data, windows and config were featurized before.
+    mmap_mode='r' returns the cache file memory-mapped instead of read into memory.
+    """
+    path = cache_path(signal, starts, length, fs, config, cache_dir)
+    if os.path.exists(path):
+        print(f"Loaded features from {path}")
+        return np.load(path, mmap_mode=mmap_mode)
+    features = features_for_starts(window_view(signal, length), starts, fs, config)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, features)
+    os.replace(tmp_path, path)  # never leave a half-written cache file behind
+    print(f"Saved features to {path}")
+    return np.load(path, mmap_mode=mmap_mode) if mmap_mode else features
+
+
+class RollingFeatures:
+    """
+    extract_features() of the latest `length` samples, kept up to date as
+    blocks arrive instead of recomputed from the whole window:
+
+    - running sums of x, x^2, channel cross products and of the first and
+      second differences give mean/std, Hjorth parameters and covariance,
+    - a sliding DFT of the bins the bands need gives the band powers; the
+      Hann window and the mean removal are applied in the frequency domain
+      (0.5 X[k] - 0.25 X[k-1] - 0.25 X[k+1]),
+    - peak-to-peak is read off the ring buffer (a vectorized pass over
+      `length` samples, a few microseconds).
+
+    Each update costs O(block * bins) whatever the window length, so
+    features() can be called at every hop, or every sample. The state is
+    recomputed exactly from the buffer every recompute_every samples so
+    rounding errors in the running sums never build up.
+    """
+
+    def __init__(self, length, n_channels, fs, config=DEFAULT_CONFIG, recompute_every=None):
+        self.length = length
+        self.n_channels = n_channels
+        self.fs = fs
+        self.config = config
+        self.recompute_every = recompute_every or 10 * length
+        self.bins = band_bins(length, fs, config.get('bands', {}))
+        # bins up to the highest band edge, plus one for the Hann neighbour
+        self.n_bins = min(max([hi for lo, hi in self.bins], default=0) + 1, length)
+        # e^{j2pi kn/L} for every bin and shift, so an update is a lookup and a matrix product
+        self.twiddle = np.exp(2j * np.pi * np.outer(np.arange(self.n_bins), np.arange(length + 1)) / length)
+        # PSD factor and bin width per stored bin (bins past Nyquist, if any, hold no rfft power)
+        self.scale = np.zeros((self.n_bins, 1))
+        one_sided = psd_scale(length, fs)[:self.n_bins]
+        self.scale[:len(one_sided), 0] = one_sided * fs / length
+        self.buffer = np.zeros((length, n_channels))
+        self.head = 0  # buffer index of the oldest sample once the window is full
+        self.count = 0  # samples seen, capped at length
+        self.since_recompute = 0
+
+    @property
+    def ready(self):
+        return self.count == self.length
+
+    def ordered(self):
+        """The current window, oldest sample first."""
+        return np.roll(self.buffer, -self.head, axis=0)
+
+    def update(self, block):
+        block = np.asarray(block, dtype=float).reshape(-1, self.n_channels)
+        m = len(block)
+        if m == 0:
+            return
+        if not self.ready:
+            take = min(m, self.length - self.count)
+            self.buffer[self.count:self.count + take] = block[:take]
+            self.count += take
+            if self.ready:
+                self.recompute()
+            if take < m:
+                self.update(block[take:])
+            return
+        if m + 2 > self.length or self.since_recompute + m >= self.recompute_every:
+            self.push(block)
+            self.recompute()
+            return
+
+        # the m + 2 oldest samples (leaving) and the 2 newest, read straight from the ring
+        oldest = self.buffer[(self.head + np.arange(m + 2)) % self.length]
+        newest = self.buffer[(self.head - 2 + np.arange(2)) % self.length]
+        leaving = oldest[:m]
+        change = block - leaving
+        # first and second differences entering and leaving the window
+        entering_d = np.diff(np.concatenate((newest, block)), axis=0)
+        entering_dd = np.diff(entering_d, axis=0)
+        leaving_d = np.diff(oldest, axis=0)
+        leaving_dd = np.diff(leaving_d, axis=0)
+        entering_d, leaving_d = entering_d[1:], leaving_d[:m]
+
+        self.s1 += change.sum(axis=0)
+        self.s2 += (block ** 2 - leaving ** 2).sum(axis=0)
+        self.cross += block.T @ block - leaving.T @ leaving
+        self.d1 += entering_d.sum(axis=0) - leaving_d.sum(axis=0)
+        self.d2 += (entering_d ** 2).sum(axis=0) - (leaving_d ** 2).sum(axis=0)
+        self.dd1 += entering_dd.sum(axis=0) - leaving_dd.sum(axis=0)
+        self.dd2 += (entering_dd ** 2).sum(axis=0) - (leaving_dd ** 2).sum(axis=0)
+        if self.n_bins:
+            # X'[k] = e^{j2pi km/L} X[k] + sum_i (new_i - old_i) e^{j2pi k(m-i)/L}
+            self.spectrum = self.twiddle[:, m:m + 1] * self.spectrum + self.twiddle[:, m:0:-1] @ change
+        self.push(block)
+        self.since_recompute += m
+
+    def push(self, block):
+        block = block[-self.length:]
+        idx = (self.head + np.arange(len(block))) % self.length
+        self.buffer[idx] = block
+        self.head = (self.head + len(block)) % self.length
+
+    def recompute(self):
+        window = self.ordered()
+        dx = np.diff(window, axis=0)
+        ddx = np.diff(dx, axis=0)
+        self.s1, self.s2 = window.sum(axis=0), (window ** 2).sum(axis=0)
+        self.cross = window.T @ window
+        self.d1, self.d2 = dx.sum(axis=0), (dx ** 2).sum(axis=0)
+        self.dd1, self.dd2 = ddx.sum(axis=0), (ddx ** 2).sum(axis=0)
+        self.spectrum = np.fft.fft(window, axis=0)[:self.n_bins]
+        self.since_recompute = 0
+
+    def features(self):
+        """(1, features) for the current window, equal to extract_features(window[np.newaxis], fs, config)."""
+        config, n = self.config, self.length
+        mean = self.s1 / n
+        var = np.maximum(self.s2 / n - mean ** 2, 0)
+        columns = []
+        if config.get('stats'):
+            columns += [mean, np.sqrt(var * n / (n - config.get('ddof', 1)))]
+        if config.get('bands'):
+            centered = self.spectrum.copy()
+            centered[0] -= self.s1
+            # neighbours k-1 and k+1; the bin below 0 is the conjugate of bin 1 for a real signal
+            below = np.concatenate((np.conj(centered[1:2]), centered[:-1]))
+            above = np.concatenate((centered[1:], np.zeros((1, self.n_channels))))
+            hann_spectrum = 0.5 * centered - 0.25 * below - 0.25 * above
+            # power per bin, summed over each band's [lo, hi) bins through a cumulative sum
+            power = np.concatenate((np.zeros((1, self.n_channels)),
+                                    np.cumsum(np.abs(hann_spectrum) ** 2 * self.scale, axis=0)))
+            columns += [np.log10(np.maximum(power[hi] - power[lo], 1e-20)) for lo, hi in self.bins]
+        if config.get('hjorth'):
+            var_dx = np.maximum(self.d2 / (n - 1) - (self.d1 / (n - 1)) ** 2, 0)
+            var_ddx = np.maximum(self.dd2 / (n - 2) - (self.dd1 / (n - 2)) ** 2, 0)
+            columns += hjorth_from_variances(var, var_dx, var_ddx)
+        if config.get('ptp'):
+            columns.append(np.ptp(self.buffer, axis=0))
+        if config.get('covariance'):
+            cov = self.cross / n - np.outer(mean, mean)
+            rows, cols = upper_pairs(self.n_channels)
+            columns.append(cov[rows, cols])
+        return np.concatenate([np.ravel(column) for column in columns])[np.newaxis]
@@ -0,0 +1,182 @@
+from functools import lru_cache
+import numpy as np
+from scipy.signal import butter, firwin, iirnotch, lfilter, lfilter_zi, tf2sos, sosfiltfilt, sosfilt, sosfilt_zi
+
+"""
+Filter bank shared by s3 and the live scripts.
+
+The bandpass (and optional notch) are designed once as second-order sections
+(SOS), which stay numerically stable at low cutoffs like 0.5 Hz where the
+b, a form loses precision, and are cached by their settings so building the
+same FilterBank again costs nothing. The whole cascade runs over every
+channel of a 2D (samples, channels) array in one call.
+
+Zero-phase filtering needs the future of the signal, so the live scripts use
+StreamingFilter instead: the same cascade run causally, carrying the filter
+state from one chunk to the next so each update only costs the new samples.
+s3 --causal filters the training data the same way so models see identical
+preprocessing offline and live.
+
+For recordings too long to hold in memory, zero_phase_blocks() does the
+zero-phase filtering block by block (overlap-save): each block is filtered
+together with enough samples on both sides for the filter's response to die
+out, and only the middle is kept, so the result matches filtering the whole
+signal at once to within the chosen tolerance.
+
+Bundles trained at a lower rate than the board (s3 --fs 100 on the 200 Hz
+Ganglion) get the live stream through StreamingDecimator first: the
+anti-aliasing FIR resample_poly uses, run causally, keeping every factor-th
+sample on the same grid as resample_poly's output. s3 --causal --fs uses it
+too, so those models train on exactly the samples they see live.
+"""
+
+
+@lru_cache(maxsize=None)
+def design_sos(fs, band, order=4, notch_freq=None, quality=30, dtype='float64'):
+    """Bandpass (+ notch) cascade as SOS, cached by its settings. Treat the result as read-only."""
+    nyquist = 0.5 * fs  # Nyquist frequency
+    low, high = band
+    sos = butter(order, [low / nyquist, high / nyquist], btype='band', output='sos')
+    if notch_freq is not None:
+        b, a = iirnotch(notch_freq / nyquist, quality)
+        sos = np.vstack([sos, tf2sos(b, a)])
+    return sos.astype(dtype)
+
+
+class FilterBank:
+    """
+    Zero-phase bandpass/notch cascade for (samples, channels) arrays.
+    dtype='float32' halves memory and is faster on long recordings.
+    """
+
+    def __init__(self, fs, band=(0.5, 50), order=4, notch_freq=None, quality=30, dtype='float64'):
+        self.fs = fs
+        self.band = tuple(band)
+        self.order = order
+        self.notch_freq = notch_freq
+        self.quality = quality
+        self.dtype = np.dtype(dtype)
+        self.sos = design_sos(fs, self.band, order, notch_freq, quality, self.dtype.name)
+
+    def apply(self, data, axis=0):
+        """Forward-backward filter every channel at once (like filtfilt, no phase shift)."""
+        data = np.asarray(data, dtype=self.dtype)
+        return sosfiltfilt(self.sos, data, axis=axis)
+
+    def streaming(self):
+        return StreamingFilter(self)
+
+    def settle_length(self, tol=1e-8, max_seconds=120):
+        """Samples until the impulse response stays below tol of its peak, the overlap zero_phase_blocks needs."""
+        impulse = np.zeros(int(max_seconds * self.fs))
+        impulse[0] = 1.0
+        response = np.abs(sosfilt(self.sos.astype(np.float64), impulse))
+        above = np.nonzero(response > tol * response.max())[0]
+        return int(above[-1]) + 1
+
+
+def zero_phase_blocks(chunks, filter_bank, block_size=60000, pad=None):
+    """
+    Zero-phase filter a long signal that arrives as consecutive (samples, channels)
+    chunks of any size. Yields filtered blocks of block_size samples (the last
+    one can be longer, up to block_size + pad) in order, holding at most one chunk plus block_size + 2 * pad
+    samples in memory.
+    """
+    if pad is None:
+        pad = filter_bank.settle_length()
+    buffer = None
+    buffer_start = 0  # sample number of buffer[0]
+    out_pos = 0  # next sample to output
+
+    def filter_block(end):
+        #filter from pad samples before the block (or the start of the signal) to end, keep out_pos onwards
+        segment_start = max(out_pos - pad, buffer_start)
+        filtered = filter_bank.apply(buffer[segment_start - buffer_start:end - buffer_start], axis=0)
+        return filtered[out_pos - segment_start:]
+
+    for chunk in chunks:
+        chunk = np.asarray(chunk, dtype=filter_bank.dtype)
+        buffer = chunk if buffer is None else np.concatenate((buffer, chunk))
+        # a block is ready once pad samples after it have arrived
+        while buffer_start + len(buffer) >= out_pos + block_size + pad:
+            yield filter_block(out_pos + block_size + pad)[:block_size]
+            out_pos += block_size
+            drop = max(out_pos - pad, buffer_start) - buffer_start
+            buffer = buffer[drop:]
+            buffer_start += drop
+
+    # the end of the signal: filter what is left, padding like the whole-signal filter does
+    if buffer is not None and out_pos < buffer_start + len(buffer):
+        yield filter_block(buffer_start + len(buffer))
+
+
+class StreamingFilter:
+    """
+    Causal version of a FilterBank for data that arrives in chunks.
+    process() must be fed consecutive (samples, channels) chunks of one
+    stream, the output is the same as filtering the concatenated stream in
+    one go with sosfilt.
+    """
+
+    def __init__(self, filter_bank):
+        self.sos = filter_bank.sos
+        self.dtype = filter_bank.dtype
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, chunk):
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        if chunk.shape[0] == 0:
+            return chunk
+        if self.zi is None:
+            #start in steady state for the first sample so there is no step response at the start
+            zi = sosfilt_zi(self.sos).astype(self.dtype)  # (sections, 2)
+            self.zi = zi[:, :, np.newaxis] * chunk[0]  # (sections, 2, channels)
+        filtered, self.zi = sosfilt(self.sos, chunk, axis=0, zi=self.zi)
+        return filtered
+
+
+def decimation_taps(factor):
+    """The anti-aliasing lowpass resample_poly(x, 1, factor) applies (scipy's default Kaiser design)."""
+    half_length = 10 * factor
+    return firwin(2 * half_length + 1, 1.0 / factor, window=('kaiser', 5.0))
+
+
+class StreamingDecimator:
+    """
+    Causal anti-aliasing filter plus downsampling by an integer factor for
+    consecutive (samples, channels) chunks of one stream. Keeps samples
+    0, factor, 2 * factor, ... of the whole stream, delayed by the filter's
+    half length (10 * factor input samples).
+    """
+
+    def __init__(self, factor, dtype='float64'):
+        self.factor = int(factor)
+        self.dtype = np.dtype(dtype)
+        self.taps = decimation_taps(self.factor).astype(self.dtype)
+        self.zi = None
+        self.total = 0  # input samples seen so far
+
+    def reset(self):
+        self.zi = None
+        self.total = 0
+
+    def kept(self, n):
+        """Indices of the next n input samples that survive the downsampling."""
+        first = -self.total % self.factor
+        return np.arange(first, n, self.factor)
+
+    def process(self, chunk):
+        """(downsampled chunk, indices of the kept input samples) so other rows, like timestamps, can follow."""
+        chunk = np.asarray(chunk, dtype=self.dtype)
+        keep = self.kept(chunk.shape[0])
+        if chunk.shape[0] == 0:
+            return chunk, keep
+        if self.zi is None:
+            #start in steady state for the first sample, like StreamingFilter
+            self.zi = lfilter_zi(self.taps, 1.0).astype(self.dtype)[:, np.newaxis] * chunk[0]
+        filtered, self.zi = lfilter(self.taps, 1.0, chunk, axis=0, zi=self.zi)
+        self.total += chunk.shape[0]
+        return filtered[keep], keep
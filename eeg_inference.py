@@ -0,0 +1,61 @@
+import numpy as np
+
+"""
+Runs the CNN exported by s5 as a .tflite file without importing TensorFlow.
+
+The interpreter comes from the first of these that is installed:
+tflite_runtime (pip install tflite-runtime, a few MB), ai_edge_litert (its
+successor) or full TensorFlow's tf.lite as a fallback. Loading takes
+milliseconds instead of the seconds Keras needs, and one invoke() on a
+single window skips all of model.predict()'s per-call batching overhead.
+
+Int8-quantized models with integer inputs/outputs are handled here too:
+inputs are quantized and outputs dequantized with the scales stored in the
+model, so callers always pass and get floats.
+"""
+
+
+def load_interpreter_class():
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """The predict()/input_shape parts of a Keras model, backed by a TFLite interpreter."""
+
+    def __init__(self, path, num_threads=1):
+        self.interpreter = load_interpreter_class()(model_path=path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.input_shape = tuple(self.input['shape'])
+
+    def quantize(self, batch):
+        scale, zero_point = self.input['quantization']
+        if self.input['dtype'] == np.float32 or not scale:
+            return batch.astype(self.input['dtype'])
+        info = np.iinfo(self.input['dtype'])
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(self.input['dtype'])
+
+    def dequantize(self, output):
+        scale, zero_point = self.output['quantization']
+        if self.output['dtype'] == np.float32 or not scale:
+            return output.astype(np.float32)
+        return (output.astype(np.float32) - zero_point) * scale
+
+    def predict(self, batch, verbose=0):
+        """Class probabilities for a batch of windows shaped like the model input, one invoke per window."""
+        batch = np.asarray(batch, dtype=np.float32).reshape((-1,) + self.input_shape[1:])
+        outputs = []
+        for window in batch:
+            self.interpreter.set_tensor(self.input['index'], self.quantize(window[np.newaxis]))
+            self.interpreter.invoke()
+            outputs.append(self.dequantize(self.interpreter.get_tensor(self.output['index']))[0])
+        return np.array(outputs)
@@ -0,0 +1,37 @@
+import csv
+import os
+import numpy as np
+
+"""
+Labels are stored as key-press transitions, (time, label) pairs written only
+when the label changes, instead of polling the current label every 0.1 s.
+A label holds from its key press until the next one, so every sample gets
+the label that was active when it was recorded.
+"""
+
+
+def read_label_events(path):
+    """Load (time, label) transitions, sorted by time. Older polled label files load the same way."""
+    if not os.path.exists(path):
+        return np.array([]), np.array([], dtype=object)
+    with open(path, newline='') as file:
+        rows = [(float(row[0]), row[1]) for row in csv.reader(file) if len(row) == 2]
+    rows.sort(key=lambda row: row[0])
+    event_times = np.array([row[0] for row in rows])
+    event_labels = np.array([row[1] for row in rows], dtype=object)
+    return event_times, event_labels
+
+
+def labels_at(times, event_times, event_labels, default='nothing'):
+    """
+    Label active at each time, found with one sorted search: O(N log M)
+    for N samples and M events instead of scanning every label per sample.
+    Samples before the first event get default.
+    """
+    times = np.asarray(times, dtype=float)
+    if len(event_times) == 0:
+        return np.full(times.shape, default, dtype=object)
+    idx = np.searchsorted(event_times, times, side='right') - 1
+    labels = np.asarray(event_labels, dtype=object)[np.clip(idx, 0, None)]
+    labels[idx < 0] = default
+    return labels
@@ -0,0 +1,71 @@
+import numpy as np
+from scipy.special import expit
+
+"""
+A plain-numpy copy of a calibrated linear SVM from s53 for live prediction.
+
+sklearn's predict_proba re-validates its input and walks every pipeline
+step and per-class calibrator in Python, which costs more than the maths
+for a single feature vector. CompactLinearSVM takes the fitted
+CalibratedClassifierCV(FrozenEstimator(pipeline)) apart once:
+
+- the StandardScaler is folded into the linear weights,
+- a Nystroem or RBFSampler kernel map is kept as its fitted arrays,
+- the sigmoid calibrators become one (a, b) pair per class,
+
+so predicting a window is a couple of small matrix products. It returns the
+same probabilities as the sklearn model and has the same predict /
+predict_proba / classes_ interface, so it is saved in place of it.
+"""
+
+
+class CompactLinearSVM:
+    def __init__(self, calibrated):
+        steps = [step for _, step in calibrated.calibrated_classifiers_[0].estimator.estimator.steps]
+        scaler, *kernel, classifier = steps
+        self.classes_ = calibrated.classes_
+        self.mean = scaler.mean_
+        self.scale = scaler.scale_
+        self.kernel = None
+        weights = classifier.coef_.T
+        intercept = classifier.intercept_
+        if kernel:
+            kernel = kernel[0]
+            if hasattr(kernel, 'random_weights_'):
+                self.kernel = ('rff', kernel.random_weights_, kernel.random_offset_, (2.0 / kernel.n_components) ** 0.5)
+            else:
+                gamma = kernel.gamma if kernel.gamma is not None else 1.0 / len(self.mean)
+                self.kernel = ('nystroem', kernel.components_, kernel.normalization_.T, gamma)
+        else:
+            # ((x - mean) / scale) @ W + b == x @ (W / scale) + (b - (mean / scale) @ W)
+            weights = weights / self.scale[:, np.newaxis]
+            intercept = intercept - (self.mean / self.scale) @ classifier.coef_.T
+        self.weights = weights
+        self.intercept = intercept
+        calibrators = calibrated.calibrated_classifiers_[0].calibrators
+        self.a = np.array([calibrator.a_ for calibrator in calibrators])
+        self.b = np.array([calibrator.b_ for calibrator in calibrators])
+
+    def decision_function(self, X):
+        X = np.asarray(X, dtype=float)
+        if self.kernel is None:
+            return X @ self.weights + self.intercept
+        Z = (X - self.mean) / self.scale
+        kind, first, second, third = self.kernel
+        if kind == 'rff':
+            Z = np.cos(Z @ first + second) * third
+        else:
+            sq_dist = (Z ** 2).sum(axis=1)[:, np.newaxis] - 2 * Z @ first.T + (first ** 2).sum(axis=1)
+            Z = np.exp(-third * np.maximum(sq_dist, 0)) @ second
+        return Z @ self.weights + self.intercept
+
+    def predict_proba(self, X):
+        scores = expit(-(self.a * self.decision_function(X) + self.b))
+        if len(self.classes_) == 2:
+            return np.column_stack((1 - scores[:, 0], scores[:, 0]))
+        total = scores.sum(axis=1, keepdims=True)
+        uniform = np.full_like(scores, 1.0 / len(self.classes_))
+        return np.divide(scores, total, out=uniform, where=total != 0)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
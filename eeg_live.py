@@ -0,0 +1,423 @@
+import argparse
+import threading
+import time
+from collections import deque
+import numpy as np
+from brainflow.board_shim import BoardShim
+from scipy.signal import resample_poly
+from eeg_acquisition import create_board
+from eeg_bundle import load_bundle
+from eeg_filters import StreamingDecimator
+from eeg_metrics import NULL_METRICS, create_metrics
+from eeg_publisher import create_publisher
+from eeg_replay import check_offline_agreement, print_benchmark
+
+"""
+Sliding-window live classification shared by the live scripts.
+
+Instead of predicting on one window and sleeping for a whole epoch, the
+latest window_samples filtered samples are kept in a RingBuffer and a
+prediction is made every hop_samples new samples, on the overlapping window
+ending at that sample. Blocks from the board are split at hop boundaries, so
+a block holding several hops gives a decision at each of them, exactly
+where an offline pass would put them.
+
+LiveEngine runs this on an acquisition thread and the model on an inference
+thread. Acquisition is paced by the data: it only waits (poll_interval)
+while the board has nothing new, and never sleeps a fixed epoch length.
+
+add_live_arguments() and run_live() are the command line and run loop the
+live scripts share: the engine, metrics and publisher flags, printing the
+label when it changes, and the report at the end. bundle_main() is the
+whole of a single-bundle live script (s62, s6), which only picks its
+default bundle.
+
+A bundle trained at a lower rate than the board (s3 --fs 100) gets the
+stream through a causal anti-aliasing decimator before the bandpass, so
+hops, windows and sample counts are all at the bundle's fs.
+
+Decision latency is the time from the last sample of a window arriving
+(its BrainFlow timestamp, which the replay board sets to its replay arrival
+time) to that window's prediction being ready. Every stage on the way is
+timed into a Metrics object, see eeg_metrics.py.
+"""
+
+
+# Latencies kept for the end-of-run report: the latest ones only, so a long live session doesn't grow without bound
+LATENCY_HISTORY = 10000
+
+
+class RingBuffer:
+    """
+    The latest `capacity` samples of a (samples, channels) stream. Every
+    sample is written twice, `capacity` rows apart, so latest() is always
+    one contiguous slice: a view, never a copy.
+    """
+
+    def __init__(self, capacity, n_channels, dtype=float):
+        self.capacity = capacity
+        self.data = np.zeros((2 * capacity, n_channels), dtype=dtype)
+        self.total = 0  # samples appended so far
+
+    def append(self, block):
+        count = len(block)
+        block = block[-self.capacity:]
+        idx = (self.total + count - len(block) + np.arange(len(block))) % self.capacity
+        self.data[idx] = block
+        self.data[idx + self.capacity] = block
+        self.total += count
+
+    def latest(self, n=None):
+        """View of the newest n samples (default: all capacity), oldest first. Valid until the next append."""
+        n = self.capacity if n is None else n
+        end = self.total % self.capacity + self.capacity
+        return self.data[end - n:end]
+
+    @property
+    def full(self):
+        return self.total >= self.capacity
+
+
+class SlidingClassifier:
+    """Filters raw board blocks and runs a bundle on the window ending at every hop."""
+
+    def __init__(self, bundle, board_id, hop_samples, metrics=NULL_METRICS):
+        self.bundle = bundle
+        self.labels = bundle.labels
+        self.metrics = metrics
+        self.eeg_channels = BoardShim.get_eeg_channels(board_id)
+        self.timestamp_channel = BoardShim.get_timestamp_channel(board_id)
+        self.hop_samples = hop_samples  # in samples at the bundle's fs, like every count below
+        # down to the bundle's fs first when it was trained at a lower rate than the board streams
+        self.decimator = bundle.decimator(BoardShim.get_sampling_rate(board_id))
+        self.filter_bank = bundle.filter_bank()
+        self.stream_filter = self.filter_bank.streaming()
+        if not bundle.causal:
+            # live filtering can only be causal, so windows are phase-shifted relative to what the model trained on
+            print(f"Warning: bundle '{bundle.name}' was trained on zero-phase filtered data but live filtering is causal. "
+                  f"Re-run s3 with --causal and retrain for matching preprocessing.")
+        self.ring = RingBuffer(bundle.window_samples, len(self.eeg_channels))
+        # feature bundles keep their features up to date sample by sample, see eeg_features.RollingFeatures
+        self.rolling = bundle.rolling_features() if bundle.feature_config is not None else None
+        self.next_end = bundle.window_samples  # sample count at which the next decision is due
+        self.feature_time = 0.0  # buffering/feature time spent on the window in progress
+
+    def window_payload(self, copy):
+        """What the model needs for the current window: the feature vector, or the filtered window itself."""
+        if self.rolling is not None:
+            return self.rolling.features()
+        return self.ring.latest().copy() if copy else self.ring.latest()
+
+    def predict_payload(self, payload):
+        if self.rolling is not None:
+            return self.bundle.predict_proba_features(payload)
+        return self.bundle.predict_proba(payload)
+
+    def windows(self, data, copy=False):
+        """
+        Take a BrainFlow block (rows, samples) and yield (end sample, payload,
+        timestamp of the window's last sample) for every hop boundary it
+        crosses. Without copy the payload is only valid until the next one.
+        """
+        t0 = time.perf_counter()
+        eeg, timestamps = self.board_block(data)
+        filtered = self.stream_filter.process(eeg)
+        self.metrics.observe('filter', time.perf_counter() - t0)
+        return self.filtered_windows(filtered, timestamps, copy)
+
+    def board_block(self, data):
+        """(samples, EEG channels) and timestamps of a BrainFlow block, at the bundle's fs."""
+        eeg = data[self.eeg_channels, :].T
+        timestamps = data[self.timestamp_channel]
+        if self.decimator is None:
+            return eeg, timestamps
+        eeg, kept = self.decimator.process(eeg)
+        return eeg, timestamps[kept]
+
+    def filtered_windows(self, filtered, timestamps, copy=False):
+        """windows() for a block that is already filtered, (samples, EEG channels) plus its timestamps."""
+        block_start = self.ring.total
+        while len(filtered):
+            t0 = time.perf_counter()
+            take = min(len(filtered), self.next_end - self.ring.total)
+            piece, filtered = filtered[:take], filtered[take:]
+            self.ring.append(piece)
+            if self.rolling is not None:
+                self.rolling.update(piece[:, self.bundle.board_channels])
+            if self.ring.total != self.next_end:
+                self.feature_time += time.perf_counter() - t0
+                continue
+            payload = self.window_payload(copy)
+            self.metrics.observe('features', self.feature_time + time.perf_counter() - t0)
+            self.feature_time = 0.0
+            yield self.next_end, payload, timestamps[self.next_end - block_start - 1]
+            self.next_end += self.hop_samples
+
+    def offline_signal(self, eeg):
+        """
+        A whole (samples, EEG channels) board recording brought to the
+        bundle's fs and filtered the way s3 did it for the training data.
+        """
+        if self.decimator is not None:
+            factor = self.decimator.factor
+            if self.bundle.causal:
+                eeg, _ = StreamingDecimator(factor).process(eeg)
+            else:
+                eeg = resample_poly(eeg, 1, factor, axis=0)
+        if self.bundle.causal:
+            return self.filter_bank.streaming().process(eeg)
+        return self.filter_bank.apply(eeg, axis=0)
+
+    def process(self, data):
+        """(end sample, probabilities, last sample timestamp) for every hop boundary in a block."""
+        return [(end, self.predict_payload(payload), sample_time) for end, payload, sample_time in self.windows(data)]
+
+
+class LiveEngine:
+    """
+    Acquisition and inference on separate threads, joined by a bounded queue.
+
+    The acquisition thread pulls from the board, filters and cuts windows
+    (and for feature bundles keeps the rolling features up to date), so a
+    slow model never delays the next data pull. The inference thread runs
+    the bundle on queued windows. When inference falls behind:
+    - the queue holds at most queue_size windows and drops the oldest one
+      when a new one arrives,
+    - a window whose last sample is more than `deadline` seconds old when
+      the worker gets to it is skipped, its decision would be stale.
+
+    Any bundle works (LDA, SVM, CNN), since SlidingClassifier hides the
+    difference. on_decision(end, label, probabilities, sample_time) runs on
+    the inference thread. Stage timings and window counts go to
+    classifier.metrics.
+    """
+
+    def __init__(self, board, classifier, on_decision, queue_size=4, deadline=0.5, poll_interval=0.002):
+        self.board = board
+        self.classifier = classifier
+        self.on_decision = on_decision
+        self.metrics = classifier.metrics
+        self.deadline = deadline
+        self.poll_interval = poll_interval
+        self.queue = deque(maxlen=queue_size)
+        self.ready = threading.Condition()
+        self.stopping = threading.Event()
+        self.acquisition_done = False
+        self.produced = 0
+        self.dropped = 0  # pushed out of the full queue
+        self.expired = 0  # past their deadline when the worker got to them
+        self.predicted = 0
+        self.compute_latencies = deque(maxlen=LATENCY_HISTORY)
+        self.decision_latencies = deque(maxlen=LATENCY_HISTORY)
+        self.threads = [threading.Thread(target=self.acquire, name='acquisition', daemon=True),
+                        threading.Thread(target=self.infer, name='inference', daemon=True)]
+
+    def start(self):
+        self.started = time.perf_counter()
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        with self.ready:
+            self.ready.notify_all()
+
+    def join(self):
+        """Wait until the board finishes (replay) and every queued window is handled, or Ctrl+C."""
+        try:
+            while any(thread.is_alive() for thread in self.threads):
+                for thread in self.threads:
+                    thread.join(timeout=0.2)
+        except KeyboardInterrupt:
+            print("Live classification stopped.")
+            self.stop()
+            for thread in self.threads:
+                thread.join()
+        self.wall_time = time.perf_counter() - self.started
+
+    def acquire(self):
+        try:
+            while not self.stopping.is_set() and not getattr(self.board, 'finished', False):
+                if self.board.get_board_data_count() == 0:
+                    time.sleep(self.poll_interval)  # nothing new yet
+                    continue
+                self.pull()
+            if not self.stopping.is_set():
+                self.pull()  # whatever arrived after the last poll, so its windows aren't lost
+        finally:
+            with self.ready:
+                self.acquisition_done = True
+                self.ready.notify_all()
+
+    def pull(self):
+        """Take everything the board has buffered and queue the windows it completes."""
+        t0 = time.perf_counter()
+        data = self.board.get_board_data()
+        self.metrics.observe('pull', time.perf_counter() - t0)
+        for end, payload, sample_time in self.classifier.windows(data, copy=True):
+            with self.ready:
+                if len(self.queue) == self.queue.maxlen:
+                    self.dropped += 1  # the deque pushes the oldest window out
+                    self.metrics.increment('dropped')
+                self.queue.append((end, payload, sample_time, time.perf_counter()))
+                self.produced += 1
+                self.metrics.increment('cut')
+                self.ready.notify()
+
+    def infer(self):
+        while True:
+            with self.ready:
+                while not self.queue and not self.acquisition_done and not self.stopping.is_set():
+                    self.ready.wait()
+                if self.stopping.is_set() or not self.queue:
+                    return
+                end, payload, sample_time, queued = self.queue.popleft()
+            t0 = time.perf_counter()
+            self.metrics.observe('queue', t0 - queued)
+            if time.time() - sample_time > self.deadline:
+                self.expired += 1
+                self.metrics.increment('expired')
+                continue
+            probabilities = self.classifier.predict_payload(payload)
+            compute_latency = time.perf_counter() - t0
+            decision_latency = time.time() - sample_time
+            self.metrics.observe('predict', compute_latency)
+            self.metrics.observe('decision', decision_latency)
+            self.metrics.increment('predicted')
+            self.compute_latencies.append(compute_latency)
+            self.decision_latencies.append(decision_latency)
+            self.predicted += 1
+            self.on_decision(end, self.classifier.labels[np.argmax(probabilities)], probabilities, sample_time)
+
+    def print_stats(self):
+        wall_time = getattr(self, 'wall_time', time.perf_counter() - self.started)
+        print(f"Windows: {self.produced} cut, {self.predicted} predicted ({self.predicted / wall_time:.1f}/s), "
+              f"{self.dropped} dropped from the full queue, {self.expired} past the {self.deadline * 1000:.0f} ms deadline")
+
+
+def print_decision_latency(decision_latencies, hop_samples, fs):
+    """How long after a window's last sample arrived its decision was ready."""
+    if not decision_latencies:
+        return
+    latencies_ms = np.array(decision_latencies) * 1000
+    print(f"Decision every {1000 * hop_samples / fs:.0f} ms; latency from last sample to decision: "
+          f"mean {latencies_ms.mean():.2f} ms, p50 {np.percentile(latencies_ms, 50):.2f} ms, "
+          f"p95 {np.percentile(latencies_ms, 95):.2f} ms, max {latencies_ms.max():.2f} ms")
+
+
+def add_live_arguments(parser):
+    """The board, hop, engine, metrics and publisher flags every live script takes."""
+    parser.add_argument("--synthetic", action="store_true", help="use BrainFlow's synthetic board instead of the Ganglion")
+    parser.add_argument("--replay", default=None, help="stream a recorded session CSV instead of a board")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 = real time")
+    parser.add_argument("--hop", type=float, default=0.1,
+                        help="seconds between predictions on the overlapping window (feature models update "
+                             "their features incrementally, so this can be tiny)")
+    parser.add_argument("--queue-size", type=int, default=4,
+                        help="windows waiting for the model, the oldest is dropped when inference falls behind")
+    parser.add_argument("--deadline", type=float, default=0.5,
+                        help="skip a window whose last sample is more than this many seconds old when the model gets to it")
+    parser.add_argument("--metrics", action="store_true", help="time every live stage and print p50/p95/p99 per stage at the end")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus-style metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-csv", default=None, help="append per-stage latency percentiles to this CSV")
+    parser.add_argument("--metrics-interval", type=float, default=5.0, help="seconds between --metrics-csv rows")
+    parser.add_argument("--publish-udp", type=int, default=None, help="publish debounced predictions to UDP subscribers on this port")
+    parser.add_argument("--publish-tcp", type=int, default=None, help="publish debounced predictions as JSON lines on this TCP port")
+    parser.add_argument("--publish-ws", type=int, default=None, help="publish debounced predictions on this WebSocket port")
+    parser.add_argument("--udp-target", action="append", default=[], help="also send events to this host:port (repeatable)")
+    parser.add_argument("--hold", type=int, default=3, help="decisions in a row a label needs before it's published")
+    parser.add_argument("--min-confidence", type=float, default=0.6, help="decisions below this probability don't count towards --hold")
+    parser.add_argument("--publish-idle", action="store_true", help="publish the 'nothing' label too")
+
+
+def run_live(board, classifier, args, samples_per_window, fs, keep_windows=False):
+    """
+    Open the board's session and stream it through a LiveEngine until it
+    finishes (replay) or Ctrl+C, with the metrics and publisher the
+    add_live_arguments() flags ask for. The session is always stopped and
+    released, then the report is printed. Returns
+    the (end sample, label) of every decision if keep_windows, else None.
+    """
+    # Per-stage timings (see eeg_metrics.py), a no-op unless one of the --metrics flags is given
+    metrics = create_metrics(args.metrics, args.metrics_port, args.metrics_csv, args.metrics_interval)
+    classifier.metrics = metrics
+    # Debounced prediction events for other programs (see eeg_publisher.py), None unless a --publish flag is given
+    publisher = create_publisher(args.publish_udp, args.publish_tcp, args.publish_ws, args.udp_target,
+                                 args.hold, args.min_confidence, publish_idle=args.publish_idle)
+
+    windows = []  # (end sample, predicted label) for the offline check
+    last_label = [None]
+
+    def on_decision(end, label, probabilities, sample_time):
+        # Print the prediction when it changes, a decision every hop would flood the terminal
+        if label != last_label[0]:
+            print("Predicted label:", label)
+            last_label[0] = label
+        if keep_windows:
+            windows.append((end, label))
+        if publisher is not None:
+            publisher.decision(end, label, probabilities.max(), sample_time)
+
+    # Acquisition and inference run on their own threads, so a slow prediction never delays the next data pull
+    engine = LiveEngine(board, classifier, on_decision, queue_size=args.queue_size, deadline=args.deadline)
+    board.prepare_session()
+    streaming = False
+    try:
+        board.start_stream()
+        streaming = True
+        engine.start()
+        engine.join()
+    finally:
+        engine.stop()
+        if streaming:
+            board.stop_stream()
+        board.release_session()
+        metrics.close(args.metrics_csv)
+        if publisher is not None:
+            publisher.close()
+
+    print_benchmark(engine.compute_latencies, engine.wall_time, samples_per_window, engine.predicted)
+    print_decision_latency(engine.decision_latencies, classifier.hop_samples, fs)
+    engine.print_stats()
+    if hasattr(board, 'check_consumed'):
+        board.check_consumed()
+    if metrics.enabled:
+        print("Per-stage latency:")
+        metrics.print_summary()
+    return windows if keep_windows else None
+
+
+def bundle_main(description, default_bundle, bundle_help, keras_flag=False):
+    """Command line of a live script that runs one bundle: parse, load, stream, report, optionally check offline."""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument("--bundle", default=default_bundle, help=bundle_help)
+    if keras_flag:
+        parser.add_argument("--keras", action="store_true", help="run the full Keras model even if the bundle has a TFLite export")
+    parser.add_argument("--check-offline", action="store_true",
+                        help="after a replay, re-run every window on the recording filtered like the training data and compare predictions")
+    add_live_arguments(parser)
+    args = parser.parse_args()
+
+    # Loads the model and runs one warm-up prediction
+    bundle = load_bundle(args.bundle, prefer_tflite=not getattr(args, 'keras', False))
+
+    # BrainFlow (or a replayed session) with the same interface
+    board, board_id = create_board(synthetic=args.synthetic, replay=args.replay, speed=args.speed)
+    # before run_live opens the session, so a refused bundle leaves no board streaming
+    bundle.check_board(BoardShim.get_sampling_rate(board_id))
+    # windows and hops are counted at the bundle's fs, the stream is decimated to it if the board is faster
+    hop_samples = max(1, int(round(args.hop * bundle.fs)))
+
+    # Same bandpass as s3 used for the training data, run causally on each new chunk so only new samples are
+    # filtered, then a prediction on the overlapping window ending at every hop
+    classifier = SlidingClassifier(bundle, board_id, hop_samples)
+
+    print(f"Starting live classification with '{args.bundle}', a decision every {args.hop} s. Press Ctrl+C to stop.")
+    check_offline = bool(args.replay and args.check_offline)
+    windows = run_live(board, classifier, args, bundle.window_samples, bundle.fs, keep_windows=check_offline)
+
+    if check_offline:
+        eeg_channels = BoardShim.get_eeg_channels(board_id)
+        # filtered like the training data, so a zero-phase bundle shows how much the causal live filter costs it
+        offline = classifier.offline_signal(board.data[eeg_channels, :].T)
+        check_offline_agreement(offline, windows, bundle.window_samples, bundle.predict)
@@ -0,0 +1,199 @@
+import csv
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+"""
+Per-stage latency instrumentation for the live loop.
+
+LiveEngine and SlidingClassifier time every stage of a decision with
+time.perf_counter() and hand the durations to a Metrics object:
+
+    pull        get_board_data() on the acquisition thread
+    filter      the streaming bandpass over a new block
+    features    ring buffer + rolling features (or the window copy) for one window
+    queue       time a window waited in the queue for the inference thread
+    predict     the model on one window
+    decision    last sample's BrainFlow timestamp to the decision being ready
+
+Each stage keeps its latest `window` durations in a fixed numpy ring, so
+recording one is an array write; p50/p95/p99 are only computed when someone
+asks. Counters (windows cut, dropped, expired, predicted) sit next to them.
+
+Exports, both optional:
+- Prometheus text format at http://127.0.0.1:<port>/metrics
+- a CSV row per stage every `interval` seconds
+
+Without any of them the scripts get NULL_METRICS, whose methods do nothing,
+so the disabled cost is an empty method call per stage.
+"""
+
+STAGES = ['pull', 'filter', 'features', 'queue', 'predict', 'decision']
+QUANTILES = [0.5, 0.95, 0.99]
+COUNTERS = ['cut', 'dropped', 'expired', 'predicted']
+
+
+class StageTimes:
+    """The latest `window` durations of one stage plus all-time count and sum."""
+
+    def __init__(self, window):
+        self.values = np.zeros(window)
+        self.count = 0
+        self.sum = 0.0
+
+    def add(self, seconds):
+        self.values[self.count % len(self.values)] = seconds
+        self.count += 1
+        self.sum += seconds
+
+    def recent(self):
+        return self.values[:min(self.count, len(self.values))]
+
+    def summary(self):
+        recent = self.recent()
+        if not len(recent):
+            return None
+        p50, p95, p99 = np.quantile(recent, QUANTILES)
+        return {'count': self.count, 'sum': self.sum, 'p50': p50, 'p95': p95, 'p99': p99, 'max': recent.max()}
+
+
+class Metrics:
+    # Recording is lock-free: every stage is written by one thread only, and
+    # a reader racing a write at worst sees one stale value in the ring.
+    enabled = True
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.stages = {stage: StageTimes(window) for stage in STAGES}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.server = None
+        self.writer_stop = threading.Event()
+        self.writer = None
+
+    def observe(self, stage, seconds):
+        times = self.stages.get(stage)
+        if times is None:
+            times = self.stages[stage] = StageTimes(self.window)
+        times.add(seconds)
+
+    def increment(self, counter, count=1):
+        self.counters[counter] = self.counters.get(counter, 0) + count
+
+    def snapshot(self):
+        """{stage: summary} for every stage with data, plus the counters."""
+        stages = {}
+        for stage, times in list(self.stages.items()):
+            summary = times.summary()
+            if summary is not None:
+                stages[stage] = summary
+        return stages, dict(self.counters)
+
+    def prometheus_text(self):
+        stages, counters = self.snapshot()
+        lines = ['# HELP eeg_stage_seconds Live loop stage latency over the latest window of observations',
+                 '# TYPE eeg_stage_seconds summary']
+        for stage, summary in stages.items():
+            for quantile in QUANTILES:
+                key = f"p{round(quantile * 100)}"
+                lines.append(f'eeg_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {summary[key]:.9f}')
+            lines.append(f'eeg_stage_seconds_sum{{stage="{stage}"}} {summary["sum"]:.9f}')
+            lines.append(f'eeg_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+        lines += ['# HELP eeg_windows_total Windows by what happened to them', '# TYPE eeg_windows_total counter']
+        for counter, count in counters.items():
+            lines.append(f'eeg_windows_total{{outcome="{counter}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        """Serve prometheus_text() at /metrics on a background thread."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # one line per scrape would bury the predictions
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+        print(f"Metrics at http://{host}:{self.server.server_address[1]}/metrics")
+
+    def export_csv(self, path, interval=5.0):
+        """Append one row per stage to path every interval seconds, on a background thread."""
+        def write_rows():
+            while not self.writer_stop.wait(interval):
+                self.write_csv(path)
+
+        self.writer = threading.Thread(target=write_rows, name='metrics-csv', daemon=True)
+        self.writer.start()
+
+    def write_csv(self, path):
+        stages, counters = self.snapshot()
+        new_file = not os.path.exists(path)
+        now = time.time()
+        with open(path, 'a', newline='') as file:
+            writer = csv.writer(file)
+            if new_file:
+                writer.writerow(['time', 'stage', 'count', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'] + list(counters))
+            for stage, summary in stages.items():
+                writer.writerow([f"{now:.3f}", stage, summary['count']]
+                                + [f"{summary[key] * 1000:.4f}" for key in ('p50', 'p95', 'p99', 'max')]
+                                + list(counters.values()))
+
+    def print_summary(self):
+        stages, _ = self.snapshot()
+        for stage, summary in stages.items():
+            print(f"  {stage:<9} n={summary['count']:<6} p50 {summary['p50'] * 1000:.3f} ms, "
+                  f"p95 {summary['p95'] * 1000:.3f} ms, p99 {summary['p99'] * 1000:.3f} ms, max {summary['max'] * 1000:.3f} ms")
+
+    def close(self, csv_path=None):
+        if self.writer is not None:
+            self.writer_stop.set()
+            self.writer.join()
+        if csv_path:
+            self.write_csv(csv_path)  # the final numbers, however long since the last row
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class NullMetrics:
+    """Metrics that records nothing, for when instrumentation is off."""
+    enabled = False
+
+    def observe(self, stage, seconds):
+        pass
+
+    def increment(self, counter, count=1):
+        pass
+
+    def print_summary(self):
+        pass
+
+    def close(self, csv_path=None):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def create_metrics(enabled=False, port=None, csv_path=None, interval=5.0):
+    """Metrics with the requested exports running, or NULL_METRICS when nothing asks for them."""
+    if not (enabled or port is not None or csv_path):
+        return NULL_METRICS
+    metrics = Metrics()
+    if port is not None:
+        metrics.serve(port)
+    if csv_path:
+        metrics.export_csv(csv_path, interval)
+    return metrics
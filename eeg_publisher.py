@@ -0,0 +1,251 @@
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+
+"""
+Publishes live predictions to other programs over local sockets, so nothing
+has to scrape the live scripts' stdout.
+
+Every decision goes through a Debouncer first. A label is only published once
+it has been the prediction for `hold` decisions in a row, each with at least
+`min_confidence`, and then only when it differs from the last published one.
+The idle label ('nothing') is tracked, so a blink has to end before the next
+one is sent, but isn't broadcast unless publish_idle is set.
+
+An event is one JSON object:
+
+    {"label": "left_blink", "confidence": 0.93, "sample": 5120,
+     "timestamp": <last sample's BrainFlow time>, "sent": <time.time() at send>}
+
+EventPublisher runs an asyncio loop on its own thread and serves any of:
+- UDP: every client that sends a datagram to the port (any content,
+  b'unsubscribe' to stop) gets each event as one datagram, as do fixed
+  udp_targets
+- TCP: newline-delimited JSON to every connected client
+- WebSocket: one text message per event, if the websockets package is
+  installed (pip install websockets, written against its 10+ serve() and
+  broadcast(); the listener below has no WebSocket client)
+
+publish() can be called from any thread. It hands the encoded event to the
+loop and returns, so the inference thread never waits on a client.
+
+Run this file to watch events and their publish-to-receive latency:
+
+    python eeg_publisher.py --tcp 8766
+    python eeg_publisher.py --udp 8765
+"""
+
+# A TCP client that has fallen this far behind is dropped rather than buffered for
+MAX_CLIENT_BUFFER = 64 * 1024
+
+
+class Debouncer:
+    def __init__(self, hold=3, min_confidence=0.6, idle_label='nothing', publish_idle=False):
+        self.hold = hold
+        self.min_confidence = min_confidence
+        self.idle_label = idle_label
+        self.publish_idle = publish_idle
+        self.candidate = None
+        self.streak = 0
+        self.current = idle_label
+
+    def update(self, label, confidence):
+        """True when label has just become the stable prediction and should be published."""
+        if confidence < self.min_confidence:
+            self.candidate, self.streak = None, 0  # a doubtful window breaks any streak
+            return False
+        if label == self.candidate:
+            self.streak += 1
+        else:
+            self.candidate, self.streak = label, 1
+        if self.streak < self.hold or label == self.current:
+            return False
+        self.current = label
+        return label != self.idle_label or self.publish_idle
+
+
+class UDPSubscribers(asyncio.DatagramProtocol):
+    def __init__(self, targets):
+        self.addresses = set(targets)
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if data.strip() == b'unsubscribe':
+            self.addresses.discard(address)
+        else:
+            self.addresses.add(address)
+
+    def send(self, data):
+        for address in list(self.addresses):
+            self.transport.sendto(data, address)
+
+
+class EventPublisher:
+    def __init__(self, host='127.0.0.1', udp_port=None, tcp_port=None, ws_port=None, udp_targets=(), debouncer=None):
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.ws_port = ws_port
+        self.udp_targets = [parse_address(target) for target in udp_targets]
+        self.debouncer = debouncer
+        self.loop = asyncio.new_event_loop()
+        self.udp = None
+        self.tcp_clients = set()
+        self.ws_clients = set()
+        self.servers = []
+        self.published = 0
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='publisher', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self.started.wait()
+        return self
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.open())
+        self.started.set()
+        self.loop.run_forever()
+
+    async def open(self):
+        if self.udp_port is not None or self.udp_targets:
+            transport, self.udp = await self.loop.create_datagram_endpoint(
+                lambda: UDPSubscribers(self.udp_targets), local_addr=(self.host, self.udp_port or 0))
+            self.servers.append(transport)
+            print(f"Publishing predictions over UDP on {self.host}:{transport.get_extra_info('sockname')[1]}")
+        if self.tcp_port is not None:
+            server = await asyncio.start_server(self.serve_tcp, self.host, self.tcp_port)
+            server.sockets[0].setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.servers.append(server)
+            print(f"Publishing predictions over TCP on {self.host}:{server.sockets[0].getsockname()[1]}")
+        if self.ws_port is not None:
+            try:
+                import websockets
+            except ImportError:
+                print("websockets isn't installed (pip install websockets), not publishing over WebSocket")
+            else:
+                self.websockets = websockets
+                server = await websockets.serve(self.serve_ws, self.host, self.ws_port)
+                self.servers.append(server)
+                print(f"Publishing predictions over WebSocket on ws://{self.host}:{self.ws_port}")
+
+    async def serve_tcp(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # events are tiny, don't batch them
+        self.tcp_clients.add(writer)
+        try:
+            while await reader.read(4096):
+                pass  # nothing a client sends matters, read and drop it until it disconnects
+        except ConnectionError:
+            pass
+        finally:
+            self.tcp_clients.discard(writer)
+            writer.close()
+
+    async def serve_ws(self, connection):
+        self.ws_clients.add(connection)
+        try:
+            await connection.wait_closed()
+        finally:
+            self.ws_clients.discard(connection)
+
+    def broadcast(self, message):
+        line = message.encode() + b'\n'
+        if self.udp is not None:
+            self.udp.send(line)
+        for writer in list(self.tcp_clients):
+            if writer.transport.is_closing() or writer.transport.get_write_buffer_size() > MAX_CLIENT_BUFFER:
+                self.tcp_clients.discard(writer)
+                writer.close()
+            else:
+                writer.write(line)
+        if self.ws_clients:
+            self.websockets.broadcast(self.ws_clients, message)
+
+    def publish(self, event):
+        """Send one event dict to every subscriber. Thread-safe and non-blocking."""
+        event = dict(event, sent=time.time())
+        self.loop.call_soon_threadsafe(self.broadcast, json.dumps(event))
+        self.published += 1
+
+    def decision(self, end, label, confidence, sample_time):
+        """Run one live decision through the debouncer and publish it if it's a new stable label."""
+        if self.debouncer is not None and not self.debouncer.update(label, confidence):
+            return
+        self.publish({'label': str(label), 'confidence': round(float(confidence), 4),
+                      'sample': int(end), 'timestamp': float(sample_time)})
+
+    def close(self):
+        async def shutdown():
+            for server in self.servers:
+                server.close()
+            for writer in list(self.tcp_clients):
+                writer.close()
+
+        if self.thread.is_alive():
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=2)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=2)
+
+
+def parse_address(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def create_publisher(udp_port=None, tcp_port=None, ws_port=None, udp_targets=(), hold=3, min_confidence=0.6,
+                     idle_label='nothing', publish_idle=False):
+    """A started EventPublisher with a Debouncer, or None when no port or target is given."""
+    if udp_port is None and tcp_port is None and ws_port is None and not udp_targets:
+        return None
+    debouncer = Debouncer(hold, min_confidence, idle_label, publish_idle)
+    return EventPublisher(udp_port=udp_port, tcp_port=tcp_port, ws_port=ws_port, udp_targets=udp_targets,
+                          debouncer=debouncer).start()
+
+
+def listen(host, udp_port=None, tcp_port=None):
+    """Print every event a publisher sends, with how long it took to arrive."""
+    if tcp_port is not None:
+        sock = socket.create_connection((host, tcp_port))
+        lines = sock.makefile('rb')
+    else:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.sendto(b'subscribe', (host, udp_port))
+        lines = iter(lambda: sock.recv(65536), b'')
+    latencies = []
+    try:
+        for line in lines:
+            received = time.time()
+            event = json.loads(line)
+            latencies.append(received - event['sent'])
+            print(f"{event['label']:<15} confidence {event['confidence']:.2f}, sample {event['sample']}, "
+                  f"published {1000 * latencies[-1]:.2f} ms ago, {1000 * (received - event['timestamp']):.1f} ms after its last sample")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if udp_port is not None and tcp_port is None:
+            sock.sendto(b'unsubscribe', (host, udp_port))
+        sock.close()
+    if latencies:
+        latencies_ms = sorted(1000 * latency for latency in latencies)
+        print(f"{len(latencies_ms)} events, publish-to-receive latency p50 {latencies_ms[len(latencies_ms) // 2]:.2f} ms, "
+              f"max {latencies_ms[-1]:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the prediction events a live script publishes")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--udp", type=int, default=None, help="subscribe to the publisher's UDP port")
+    parser.add_argument("--tcp", type=int, default=None, help="connect to the publisher's TCP port")
+    args = parser.parse_args()
+    if args.udp is None and args.tcp is None:
+        parser.error("give --udp or --tcp")
+    listen(args.host, args.udp, args.tcp)
@@ -0,0 +1,209 @@
+import argparse
+import csv
+import glob
+import os
+import re
+import time
+import numpy as np
+from brainflow.board_shim import BoardShim, BoardIds
+from eeg_acquisition import PACKAGE_NUM_WRAP, DEFAULT_PACKAGE_NUM_WRAP
+from eeg_labels import read_label_events, labels_at
+from eeg_timing import SampleClock
+
+"""
+Crash-safe session recording.
+
+Samples and label events are appended to two ".part" files next to the session
+CSV while recording, in fixed-size chunks, so memory stays flat no matter
+how long the session runs and a crash loses at most the last unflushed chunk.
+When recording stops the parts are merged into the usual headerless session
+CSV (time, 15 board rows, label) and deleted. The time column is rebuilt from
+the board's package counter and hardware timestamps (see eeg_timing.py), so
+it is a uniform sample clock and label events land on the right samples.
+If the process dies before that, recover_session() rebuilds the session from
+whatever made it to disk:
+    python eeg_recorder.py --recover eeg_sessions/eeg_action_data_2.csv
+"""
+
+SESSION_PATTERN = "eeg_sessions/eeg_action_data_{}.csv"
+
+
+def eeg_part_path(session_path):
+    return session_path[:-len(".csv")] + ".eeg.part"
+
+
+def label_part_path(session_path):
+    return session_path[:-len(".csv")] + ".labels.part"
+
+
+def session_number(path):
+    """N of eeg_action_data_N.csv, None for a name without one."""
+    match = re.search(r"_(\d+)\.csv$", path)
+    return int(match.group(1)) if match else None
+
+
+def session_files(pattern=SESSION_PATTERN.format("*")):
+    """Session CSVs matching a glob pattern in recording order: by N, so _10 comes after _9 and not after _1."""
+    paths = glob.glob(pattern)
+    return sorted(paths, key=lambda path: (session_number(path) is None, session_number(path) or 0, path))
+
+
+def next_session_path(pattern=SESSION_PATTERN):
+    """First unused eeg_action_data_N.csv, so sessions don't need renumbering by hand."""
+    numbers = [session_number(path) for path in glob.glob(pattern.format("*"))]
+    return pattern.format(max([number for number in numbers if number is not None], default=0) + 1)
+
+
+class ChunkedWriter:
+    """
+    Appends rows to a CSV file once chunk_rows of them have piled up.
+    Every chunk is flushed to the OS, and fsync'd at most every fsync_interval
+    seconds so a long session doesn't hammer the disk.
+    """
+
+    def __init__(self, path, chunk_rows=2000, fsync_interval=5.0):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self.fsync_interval = fsync_interval
+        self.file = open(path, mode='a', newline='')
+        self.writer = csv.writer(self.file)
+        self.pending = []
+        self.rows_written = 0
+        self.last_fsync = time.monotonic()
+
+    def append(self, rows):
+        self.pending.extend(rows)
+        if len(self.pending) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self, fsync=False):
+        if self.pending:
+            self.writer.writerows(self.pending)
+            self.rows_written += len(self.pending)
+            self.pending.clear()
+        self.file.flush()
+        if fsync or time.monotonic() - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self.last_fsync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush(fsync=True)
+            self.file.close()
+
+
+def read_chunks(path, chunk_rows=10000, convert=float):
+    """Yield lists of parsed rows without ever holding the whole file."""
+    with open(path, newline='') as file:
+        chunk = []
+        for row in csv.reader(file):
+            chunk.append([convert(value) for value in row] if convert else row)
+            if len(chunk) >= chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+def merge_labels(eeg_rows, times, event_times, event_labels):
+    chunk_labels = labels_at(times, event_times, event_labels)
+    return [[time] + row[1:] + [label] for row, time, label in zip(eeg_rows, times, chunk_labels)]
+
+
+def fit_session_clock(eeg_path, board_id, chunk_rows=10000):
+    """Fit the uniform sample clock of a recording, reading it in chunks."""
+    package_col = 1 + BoardShim.get_package_num_channel(board_id)  # column 0 is the elapsed time
+    timestamp_col = 1 + BoardShim.get_timestamp_channel(board_id)
+    clock = SampleClock(PACKAGE_NUM_WRAP.get(board_id, DEFAULT_PACKAGE_NUM_WRAP), BoardShim.get_sampling_rate(board_id))
+    for chunk in read_chunks(eeg_path, chunk_rows):
+        chunk = np.asarray(chunk)
+        clock.add(chunk[:, package_col], chunk[:, timestamp_col])
+    clock.fit()
+    for chunk in read_chunks(eeg_path, chunk_rows):
+        chunk = np.asarray(chunk)
+        clock.add_residuals(chunk[:, package_col], chunk[:, timestamp_col])
+    return clock.finish_residuals()
+
+
+def finalize_session(session_path, board_id=BoardIds.GANGLION_BOARD.value, chunk_rows=10000):
+    """
+    Merge the .part files into the session CSV chunk by chunk and remove them.
+    Returns the number of samples written.
+    """
+    eeg_path = eeg_part_path(session_path)
+    labels_path = label_part_path(session_path)
+    #label events only exist for key presses so they are small enough to read in one go
+    event_times, event_labels = read_label_events(labels_path)
+
+    package_col = 1 + BoardShim.get_package_num_channel(board_id)
+    timestamp_col = 1 + BoardShim.get_timestamp_channel(board_id)
+    clock = None
+    if os.path.exists(eeg_path) and os.path.getsize(eeg_path) > 0:
+        try:
+            clock = fit_session_clock(eeg_path, board_id, chunk_rows)
+            print(f"Sample clock: {clock.fs:.2f} Hz measured, samples placed {clock.offset * 1000:.1f} ms before arrival")
+        except ValueError as e:
+            print(f"Could not fit a sample clock ({e}), keeping receive timestamps")
+
+    #write to a temp file first so a crash here doesn't leave a half-merged session behind
+    tmp_path = session_path + ".tmp"
+    written = 0
+    with open(tmp_path, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        if os.path.exists(eeg_path):
+            for chunk in read_chunks(eeg_path, chunk_rows):
+                values = np.asarray(chunk)
+                #the elapsed time column was timestamp - start_time, keep the same zero
+                start_time = values[0, timestamp_col] - values[0, 0]
+                if clock is not None:
+                    times = clock.times(values[:, package_col], values[:, timestamp_col]) - start_time
+                else:
+                    times = values[:, 0]
+                writer.writerows(merge_labels(chunk, times.tolist(), event_times, event_labels))
+                written += len(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, session_path)
+
+    for path in (eeg_path, labels_path):
+        if os.path.exists(path):
+            os.remove(path)
+    return written
+
+
+def _drop_partial_line(path):
+    """A crash mid-write can leave half a row at the end of a part file, cut it off."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as file:
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        if size == 0:
+            return
+        block = min(size, 65536)
+        file.seek(size - block)
+        tail = file.read(block)
+        last_newline = tail.rfind(b'\n')
+        keep = size - block + last_newline + 1 if last_newline >= 0 else 0
+        if keep != size:
+            file.truncate(keep)
+
+
+def recover_session(session_path, board_id=BoardIds.GANGLION_BOARD.value):
+    """Rebuild a session whose recording crashed before it was merged."""
+    eeg_path = eeg_part_path(session_path)
+    if not os.path.exists(eeg_path):
+        raise FileNotFoundError(f"No partial recording found for {session_path}")
+    _drop_partial_line(eeg_path)
+    _drop_partial_line(label_part_path(session_path))
+    return finalize_session(session_path, board_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild a session CSV from a crashed recording")
+    parser.add_argument("--recover", required=True, help="session CSV to rebuild, e.g. eeg_sessions/eeg_action_data_2.csv")
+    parser.add_argument("--synthetic", action="store_true", help="the session was recorded from BrainFlow's synthetic board")
+    args = parser.parse_args()
+    board_id = BoardIds.SYNTHETIC_BOARD.value if args.synthetic else BoardIds.GANGLION_BOARD.value
+    samples = recover_session(args.recover, board_id)
+    print(f"Recovered {samples} samples into '{args.recover}'")
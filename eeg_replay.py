@@ -0,0 +1,138 @@
+import time
+import numpy as np
+import pandas as pd
+from brainflow.board_shim import BoardShim, BoardIds
+
+"""
+Replays a recorded session (eeg_sessions/*.csv) through the same calls the
+live scripts make on a BoardShim, so they can run without the Ganglion.
+
+Samples become available as if they were streaming at the board's sampling
+rate times speed, so speed=1 is real time and speed=10 pushes ten seconds of
+recording through per second for benchmarking the live loop.
+The session CSV is column 0 = elapsed time, columns 1-15 = the Ganglion's 15
+board rows, column 16 = label, so board row i is CSV column i + 1.
+"""
+
+
+class ReplayBoard:
+
+    def __init__(self, session_path, speed=1.0, board_id=BoardIds.GANGLION_BOARD.value):
+        self.session_path = session_path
+        self.speed = speed
+        self.board_id = board_id
+        self.fs = BoardShim.get_sampling_rate(board_id)
+        num_rows = BoardShim.get_num_rows(board_id)
+
+        session = pd.read_csv(session_path, header=None)
+        self.data = session.iloc[:, 1:num_rows + 1].to_numpy(dtype=float).T  # (num_rows, n) like BrainFlow
+        self.labels = session.iloc[:, num_rows + 1].to_numpy() if session.shape[1] > num_rows + 1 else None
+        self.num_samples = self.data.shape[1]
+        self.timestamp_channel = BoardShim.get_timestamp_channel(board_id)
+
+        self.streaming = False
+        self.start_time = None
+        self.read_position = 0  # next sample get_board_data() hands out
+        self.position = 0  # samples available at the last call, end of the last window handed out
+
+    # --- BoardShim interface ---
+    def prepare_session(self):
+        pass
+
+    def start_stream(self, *args):
+        self.streaming = True
+        self.start_time = time.perf_counter()
+        self._wall_start = time.time()
+        self.read_position = 0
+        self.position = 0
+
+    def stop_stream(self):
+        self.streaming = False
+
+    def release_session(self):
+        self.streaming = False
+
+    def get_board_data_count(self, *args):
+        return self._available() - self.read_position
+
+    def get_board_data(self, num_samples=None, *args):
+        """Remove and return everything (or the oldest num_samples) not read yet."""
+        end = self._available()
+        if num_samples is not None:
+            end = min(end, self.read_position + num_samples)
+        block = self._slice(self.read_position, end)
+        self.read_position = end
+        return block
+
+    def get_current_board_data(self, num_samples, *args):
+        """Newest num_samples without removing them, like BrainFlow."""
+        end = self._available()
+        return self._slice(max(0, end - num_samples), end)
+
+    # --- replay helpers ---
+    @property
+    def finished(self):
+        """True once every sample has been handed out by get_board_data(), not merely become available."""
+        return self.streaming and self.read_position >= self.num_samples
+
+    def check_consumed(self):
+        """
+        Warn if the run stopped before reading the whole recording: windows
+        from the unread tail would be missing, so counts and throughput in
+        the report would be too low, and a faster --speed would cut fewer.
+        """
+        if self.read_position < self.num_samples:
+            print(f"Warning: only {self.read_position} of the replay's {self.num_samples} samples were read, "
+                  f"the windows after that are missing from the numbers above")
+
+    def arrival_time(self, sample_index):
+        """perf_counter() time at which a sample became available, for latency measurements."""
+        return self.start_time + (sample_index + 1) / (self.fs * self.speed)
+
+    def _available(self):
+        if not self.streaming:
+            return self.position
+        elapsed = time.perf_counter() - self.start_time
+        self.position = min(self.num_samples, int(elapsed * self.fs * self.speed))
+        return self.position
+
+    def _slice(self, start, end):
+        block = self.data[:, start:end].copy()
+        #stamp samples with when they were replayed, like BrainFlow stamps them on arrival
+        block[self.timestamp_channel] = self._wall_start + (np.arange(start, end) + 1) / (self.fs * self.speed)
+        return block
+
+
+def print_benchmark(latencies, wall_time, samples_per_window, count=None):
+    """
+    Throughput and per-window latency of a live loop run. count is the number
+    of predictions when latencies only holds the latest ones.
+    """
+    if not latencies:
+        print("No predictions were made.")
+        return
+    count = len(latencies) if count is None else count
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{count} predictions in {wall_time:.2f} s ({count / wall_time:.1f} predictions/s, "
+          f"{count * samples_per_window / wall_time:.0f} samples/s classified)")
+    print(f"Latency per window: mean {latencies_ms.mean():.2f} ms, p50 {np.percentile(latencies_ms, 50):.2f} ms, "
+          f"p95 {np.percentile(latencies_ms, 95):.2f} ms, max {latencies_ms.max():.2f} ms")
+
+
+def check_offline_agreement(signal, windows, samples_per_window, predict):
+    """
+    Re-run predict() on exactly the windows the live loop classified, cut
+    from the whole recording preprocessed offline, and report how often the
+    two agree. signal is (samples, channels), windows is a list of
+    (end sample, live prediction).
+    """
+    matches = 0
+    checked = 0
+    for end, live_label in windows:
+        if end is None or end < samples_per_window:
+            continue
+        offline_label = predict(signal[end - samples_per_window:end])
+        matches += offline_label == live_label
+        checked += 1
+    if checked:
+        print(f"Offline and live predictions agree on {matches}/{checked} windows ({100 * matches / checked:.1f}%)")
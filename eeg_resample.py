@@ -0,0 +1,134 @@
+from fractions import Fraction
+import numpy as np
+import pandas as pd
+from scipy.signal import resample_poly
+from eeg_filters import StreamingDecimator
+
+"""
+Puts a recording on an exact uniform time grid before it is filtered.
+
+Rows coming out of s1/s2 are not evenly spaced: older sessions were polled
+with time.time() jitter, dropped packets leave holes, and s2 joins sessions
+by starting the next one at the previous one's last time. Filters and
+epoching assume one sample every 1/fs seconds, so:
+
+- the recording is split at session joins: from s2's per-session row
+  counts when the caller has them (eeg_epoching.session_rows), otherwise
+  wherever the time goes backwards, which within s2's output only happens
+  where a session starting before 0 s follows another,
+- each session is sorted by time on its own, so rows of two sessions are
+  never mixed, and split further wherever two rows are more than max_gap
+  apart; every resulting segment is numbered,
+- each segment is linearly interpolated onto t0 + k / grid_fs,
+- if target_fs is lower (e.g. 100 Hz for cheaper models) the grid is
+  decimated with a polyphase anti-aliasing filter (resample_poly), or with
+  causal=True by the StreamingDecimator the live scripts run, which needs
+  an integer factor.
+
+Gaps are never interpolated across; the Segment column marks them so
+filters and epochs can stay inside one segment.
+"""
+
+
+def estimate_fs(times):
+    """Sampling rate of a uniformly sampled Time column."""
+    steps = np.diff(np.asarray(times, dtype=float))
+    steps = steps[steps > 0]
+    return float(round(1.0 / np.median(steps), 6))
+
+
+def split_sessions(times, sessions=None):
+    """(start, end) row ranges of the sessions, in file order."""
+    if sessions is None:
+        # s2 sorts every session, so time only goes backwards where one ends and the next begins
+        sessions = np.concatenate(([0], np.cumsum(np.diff(times) < 0)))
+    sessions = np.asarray(sessions)
+    bounds = np.concatenate(([0], np.nonzero(sessions[1:] != sessions[:-1])[0] + 1, [len(sessions)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def find_segments(times, max_gap):
+    """(start, end) row ranges of sorted times with no step bigger than max_gap."""
+    steps = np.diff(times)
+    breaks = np.nonzero(steps > max_gap)[0] + 1
+    bounds = np.concatenate(([0], breaks, [len(times)]))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def interpolate_segment(times, values, labels, grid_fs):
+    """Linear interpolation of (samples, channels) values onto t0 + k / grid_fs, all channels at once."""
+    if len(times) == 1:
+        return times, values, labels
+    n_grid = int(np.floor((times[-1] - times[0]) * grid_fs + 1e-9)) + 1
+    grid = times[0] + np.arange(n_grid) / grid_fs
+    # index of the last original row at or before each grid point
+    before = np.searchsorted(times, grid, side='right') - 1
+    idx = np.clip(before, 0, len(times) - 2)
+    frac = ((grid - times[idx]) / (times[idx + 1] - times[idx]))[:, np.newaxis]
+    grid_values = values[idx] + frac * (values[idx + 1] - values[idx])
+    # labels are events, so each grid point takes the label active at that time
+    return grid, grid_values, labels[before]
+
+
+def session_segments(times, values, labels, max_gap):
+    """Sort one session by time and cut it at gaps: (times, values, labels) per segment."""
+    order = np.argsort(times, kind='stable')
+    times, values, labels = times[order], values[order], labels[order]
+    # rows with the same time can't be interpolated between, keep the first of each
+    keep = np.concatenate(([True], np.diff(times) > 0))
+    times, values, labels = times[keep], values[keep], labels[keep]
+    return [(times[start:end], values[start:end], labels[start:end]) for start, end in find_segments(times, max_gap)]
+
+
+def resample_uniform(times, values, labels, grid_fs=200, target_fs=None, max_gap=0.25, sessions=None, causal=False):
+    """
+    Resample a whole recording. times (n,) in s2's order (sorted within each
+    session), values (n, channels), labels (n,), sessions (n,) optional
+    session id of every row. Returns a DataFrame-ready dict of arrays:
+    Time, values, Label, Segment.
+    """
+    times = np.asarray(times, dtype=float)
+    values = np.asarray(values, dtype=float)
+    labels = np.asarray(labels, dtype=object)
+    target_fs = target_fs or grid_fs
+    ratio = Fraction(target_fs / grid_fs).limit_denominator(1000)
+    if causal and ratio.numerator != 1:
+        raise ValueError(f"causal decimation needs {grid_fs} Hz to be a whole multiple of {target_fs} Hz")
+
+    pieces = []
+    for start, end in split_sessions(times, sessions):
+        pieces += session_segments(times[start:end], values[start:end], labels[start:end], max_gap)
+
+    out_times, out_values, out_labels, out_segments = [], [], [], []
+    for segment, (segment_times, segment_values, segment_labels) in enumerate(pieces):
+        grid, grid_values, grid_labels = interpolate_segment(segment_times, segment_values, segment_labels, grid_fs)
+        if ratio != 1:
+            if causal:
+                grid_values, _ = StreamingDecimator(ratio.denominator).process(grid_values)
+            else:
+                grid_values = resample_poly(grid_values, ratio.numerator, ratio.denominator, axis=0)
+            new_grid = grid[0] + np.arange(len(grid_values)) / target_fs
+            grid_labels = grid_labels[np.clip(np.searchsorted(grid, new_grid, side='right') - 1, 0, len(grid) - 1)]
+            grid = new_grid
+        out_times.append(grid)
+        out_values.append(grid_values)
+        out_labels.append(grid_labels)
+        out_segments.append(np.full(len(grid), segment))
+
+    return {
+        'Time': np.concatenate(out_times),
+        'values': np.concatenate(out_values),
+        'Label': np.concatenate(out_labels),
+        'Segment': np.concatenate(out_segments),
+    }
+
+
+def resample_frame(data, value_cols, grid_fs=200, target_fs=None, max_gap=0.25, sessions=None, causal=False):
+    """resample_uniform() for a DataFrame with Time, value_cols and Label columns, in s2's row order."""
+    result = resample_uniform(data['Time'].to_numpy(), data[value_cols].to_numpy(), data['Label'].to_numpy(),
+                              grid_fs, target_fs, max_gap, sessions, causal)
+    frame = pd.DataFrame(result['values'], columns=value_cols)
+    frame.insert(0, 'Time', result['Time'])
+    frame['Label'] = result['Label']
+    frame['Segment'] = result['Segment']
+    return frame
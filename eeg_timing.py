@@ -0,0 +1,168 @@
+import numpy as np
+
+"""
+Sample timing from the board instead of time.time().
+
+BrainFlow stamps every sample when the host receives it, and BLE delivers
+samples in bursts, so consecutive timestamps jump around even though the
+Ganglion samples at a fixed rate. The package counter (board row 0) tells us
+exactly how many packets were sent, including ones that were dropped.
+SampleClock unwraps that counter into a continuous packet index and fits
+    timestamp = intercept + seconds_per_packet * packet_index
+by least squares, so every sample gets a uniform, drift-corrected time.
+The fitted line is then shifted down to the earliest arrivals (a sample
+can't arrive before it was measured), which is the offset between the
+keyboard clock and the sample clock used to map label events onto samples.
+
+The counter wraps after about a second (100 packets on the Ganglion), and
+BLE dropouts can last longer than that, so a step in the counter alone
+can't tell a 0.2 s gap from a 1.2 s one. With the board's nominal fs, each
+step is checked against the time that passed since the previous sample, and
+the whole wrap cycles that fit the gap are added back to the packet index.
+
+The fit only needs running sums and a running minimum, so a session of any
+length is handled chunk by chunk: one pass to fit, one to find the earliest
+arrivals, one to time the samples.
+"""
+
+
+class SampleClock:
+    """
+    Reconstructs a uniform sample clock from package numbers and hardware
+    timestamps. Feed every chunk in order to add(), then fit(), then to
+    add_residuals(), then finish_residuals(), then to times(). fs is the
+    board's nominal sampling rate, needed to recover dropouts longer than one
+    wrap of the counter (without it those look like short gaps).
+    """
+
+    def __init__(self, wrap=256, fs=None):
+        self.wrap = wrap
+        self.nominal_fs = fs
+        self.reset()
+        self.n_samples = 0
+        self.t_ref = None
+        #running sums for the least squares fit, x = packet index, y = timestamp - t_ref
+        self._sx = self._sy = self._sxx = self._sxy = 0.0
+        self.min_residual = None
+        self.samples_per_packet = None
+        self.seconds_per_packet = None
+        self.intercept = None
+
+    def reset(self):
+        self._last_package = None
+        self._last_packet_index = -1
+        self._last_position = 0
+        self._last_timestamp = None
+        self.n_packets = 0
+        self._samples_seen = 0
+
+    def _lost_cycles(self, steps, timestamps):
+        """Whole counter wraps hidden in each step, from how much time passed since the previous sample."""
+        if self._last_timestamp is None:
+            previous = timestamps[0]
+        else:
+            previous = self._last_timestamp
+        dt = np.diff(timestamps, prepend=previous)
+        #packets per second so far, from samples per packet seen (every pass sees the same chunks, so the same value)
+        samples = self._samples_seen + steps.size
+        packets = self.n_packets + max(int(np.count_nonzero(steps)), 1)
+        packets_per_second = self.nominal_fs * packets / samples
+        cycles = np.round((dt * packets_per_second - steps) / self.wrap)
+        return np.maximum(cycles, 0).astype(np.int64)
+
+    def _packet_positions(self, package_nums, timestamps=None):
+        """
+        Continuous packet index and position within the packet of each sample.
+        A step of k in the counter means k - 1 packets were lost, so the index
+        skips ahead by k and the lost samples keep their place on the clock.
+        With timestamps (and the nominal fs), a gap longer than the counter's
+        wrap skips ahead by the whole cycles it hid as well.
+        """
+        package_nums = np.asarray(package_nums, dtype=np.int64)
+        n = package_nums.size
+        if self._last_package is None:
+            previous = package_nums[0] - 1
+        else:
+            previous = self._last_package
+        steps = np.diff(package_nums, prepend=previous) % self.wrap
+        if timestamps is not None and self.nominal_fs:
+            timestamps = np.asarray(timestamps, dtype=float)
+            steps = steps + self.wrap * self._lost_cycles(steps, timestamps)
+            self._last_timestamp = timestamps[-1]
+        packet_index = self._last_packet_index + np.cumsum(steps)
+
+        #samples decoded from the same packet (step 0) sit one after another inside it
+        idx = np.arange(n)
+        run_starts = np.maximum.accumulate(np.where(steps > 0, idx, -1))
+        position = idx - run_starts
+        continuing = run_starts < 0  # still inside the last packet of the previous chunk
+        position[continuing] = self._last_position + 1 + idx[continuing]
+
+        self._last_package = package_nums[-1]
+        self._last_packet_index = packet_index[-1]
+        self._last_position = position[-1]
+        self.n_packets += int(np.count_nonzero(steps))
+        self._samples_seen += n
+        return packet_index.astype(float), position
+
+    def add(self, package_nums, timestamps):
+        """Accumulate one chunk into the fit."""
+        timestamps = np.asarray(timestamps, dtype=float)
+        if timestamps.size == 0:
+            return
+        if self.t_ref is None:
+            self.t_ref = timestamps[0]
+        x, _ = self._packet_positions(package_nums, timestamps)
+        y = timestamps - self.t_ref
+        self.n_samples += x.size
+        self._sx += x.sum()
+        self._sy += y.sum()
+        self._sxx += np.dot(x, x)
+        self._sxy += np.dot(x, y)
+
+    def fit(self):
+        if self.n_samples < 2:
+            raise ValueError("Need at least two samples to fit a sample clock")
+        n = self.n_samples
+        denom = n * self._sxx - self._sx ** 2
+        if denom == 0:
+            raise ValueError("Package numbers never advance, can't fit a sample clock")
+        self.seconds_per_packet = (n * self._sxy - self._sx * self._sy) / denom
+        self.intercept = (self._sy - self.seconds_per_packet * self._sx) / n
+        self.samples_per_packet = max(1, int(round(n / max(self.n_packets, 1))))
+        self.reset()
+        return self
+
+    def add_residuals(self, package_nums, timestamps):
+        """Second pass over the chunks: track the earliest arrival relative to the fitted line."""
+        residuals = np.asarray(timestamps, dtype=float) - self.times(package_nums, timestamps)
+        lowest = residuals.min()
+        if self.min_residual is None or lowest < self.min_residual:
+            self.min_residual = lowest
+
+    def finish_residuals(self):
+        """Shift the clock onto the earliest arrivals and get ready for times()."""
+        if self.min_residual is not None:
+            self.intercept += self.min_residual
+        self.reset()
+        return self
+
+    @property
+    def fs(self):
+        """Effective sampling rate measured from the hardware timestamps."""
+        return self.samples_per_packet / self.seconds_per_packet
+
+    @property
+    def offset(self):
+        """How much earlier than their receive timestamps samples are placed on the clock."""
+        return -(self.min_residual or 0.0)
+
+    def times(self, package_nums, timestamps=None):
+        """
+        Uniform sample times (same epoch as the BrainFlow timestamps) for the
+        next chunk. Pass the timestamps whenever add() got them, so long
+        dropouts are unwrapped the same way.
+        """
+        packet_index, position = self._packet_positions(package_nums, timestamps)
+        sample_offset = np.minimum(position, self.samples_per_packet - 1) / self.samples_per_packet
+        return self.t_ref + self.intercept + self.seconds_per_packet * (packet_index + sample_offset)
@@ -1,11 +1,18 @@
 from bleak import BleakScanner
 import asyncio
 
+#list every BLE device nearby
 async def main():
     devices = await BleakScanner.discover()
     for device in devices:
         print(f"Name: {device.name}, MAC Address: {device.address}")
 
-asyncio.run(main())
+#only the Ganglions, used by s1multi_headset_recording.py to find every headset in range
+async def find_ganglions(timeout=5.0):
+    devices = await BleakScanner.discover(timeout=timeout)
+    return [device.address for device in devices if device.name and 'ganglion' in device.name.lower()]
 
-#currently returns: D5:A4:BE:DD:BC:89
\ No newline at end of file
+if __name__ == "__main__":
+    asyncio.run(main())
+
+#currently returns: D5:A4:BE:DD:BC:89
@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import os
+import threading
+import time
+import numpy as np
+from brainflow.board_shim import BoardShim
+from eeg_acquisition import create_board, BlockReader
+from eeg_recorder import ChunkedWriter, eeg_part_path, label_part_path, next_session_path, finalize_session
+
+"""
+Records several headsets at once from one process, e.g. one Ganglion per subject.
+
+Boards are discovered over BLE (see s0EEG_board_mac_finder.py), connected
+concurrently and drained by one asyncio task each. Every headset gets its own
+BlockReader, chunked writers and session files under eeg_sessions/headset_<n>/,
+and all of them share the same key-press label events and start time, so the
+sessions line up when they are compared later.
+
+    python s1multi_headset_recording.py                   # every Ganglion in range
+    python s1multi_headset_recording.py --macs D5:A4:BE:DD:BC:89 ...
+    python s1multi_headset_recording.py --synthetic 8 --duration 60
+    python s1multi_headset_recording.py --replay a.csv b.csv --speed 5 --duration 10
+"""
+
+#labels and associated numbers on keyboard (same as s1)
+labels = {
+    '1': 'left_blink',
+    '2': 'right_blink',
+    '3': 'both_blink',
+    '4': 'eyebrow_raise',
+    '5': 'nothing'
+}
+
+
+class Headset:
+    """One board with its own reader, buffers and output files."""
+
+    def __init__(self, name, board, board_id, output, chunk_rows, fsync_interval):
+        self.name = name
+        self.board = board
+        self.board_id = board_id
+        self.reader = BlockReader(board, board_id)
+        self.output = output
+        if os.path.exists(eeg_part_path(output)):
+            raise SystemExit(f"A partial recording for {output} already exists, run 'python eeg_recorder.py --recover {output}' first")
+        self.eeg_writer = ChunkedWriter(eeg_part_path(output), chunk_rows, fsync_interval)
+        self.label_writer = ChunkedWriter(label_part_path(output), 1, fsync_interval)
+
+    def drain(self, start_time):
+        block = self.reader.read()
+        if block.shape[1] > 0:
+            elapsed_times = block[self.reader.timestamp_channel] - start_time
+            self.eeg_writer.append(np.column_stack((elapsed_times, block.T)).tolist())
+
+    def close_writers(self):
+        self.eeg_writer.close()
+        self.label_writer.close()
+
+
+class SharedLabels:
+    """Label events from one keyboard, written to every headset's session."""
+
+    def __init__(self, headsets, start_time):
+        self.headsets = headsets
+        self.start_time = start_time
+        self.current_label = 'nothing'
+        self.lock = threading.Lock()
+        for headset in headsets:
+            headset.label_writer.append([(0.0, self.current_label)])
+
+    def set_label(self, label):
+        with self.lock:
+            if label == self.current_label:
+                return
+            self.current_label = label
+            elapsed_time = time.time() - self.start_time
+            for headset in self.headsets:
+                headset.label_writer.append([(elapsed_time, label)])
+        print(f"Time: {elapsed_time:.1f} s, Label: {label}")
+
+
+def start_keyboard(shared_labels, stop_event, loop):
+    #imported here so synthetic/replay scaling runs work on machines without a display
+    from pynput import keyboard
+
+    def on_press(key):
+        try:
+            if key.char in labels:
+                shared_labels.set_label(labels[key.char])
+        except AttributeError:
+            pass
+
+    def on_release(key):
+        if key == keyboard.Key.esc:
+            loop.call_soon_threadsafe(stop_event.set)
+            return False
+
+    listener = keyboard.Listener(on_press=on_press, on_release=on_release)
+    listener.start()
+    print("Press keys to label actions (1: left_blink, 2: right_blink, etc.)")
+    print("Press ESC to stop recording, or Ctrl+C to force exit.")
+    return listener
+
+
+async def discover_boards(args):
+    """(name, board, board_id) for every headset we were asked to record."""
+    boards = []
+    if args.replay:
+        for path in args.replay:
+            board, board_id = create_board(replay=path, speed=args.speed)
+            boards.append((f"replay {os.path.basename(path)}", board, board_id))
+    elif args.synthetic:
+        for i in range(args.synthetic):
+            board, board_id = create_board(synthetic=True, instance=i)
+            boards.append((f"synthetic {i + 1}", board, board_id))
+    else:
+        macs = args.macs
+        if not macs:
+            from s0EEG_board_mac_finder import find_ganglions
+            print("Scanning for Ganglions...")
+            macs = await find_ganglions(args.scan_timeout)
+        if not macs:
+            raise SystemExit("No Ganglions found.")
+        serial_ports = args.serial_ports or [None] * len(macs)
+        if len(serial_ports) != len(macs):
+            raise SystemExit("Give one --serial-ports entry per headset.")
+        for mac, port in zip(macs, serial_ports):
+            board, board_id = create_board(mac_address=mac, serial_port=port)
+            boards.append((mac, board, board_id))
+    return boards
+
+
+async def connect(headset):
+    #prepare_session blocks while the BLE connection is made, so every headset connects in parallel
+    await asyncio.to_thread(headset.board.prepare_session)
+    await asyncio.to_thread(headset.board.start_stream)
+    print(f"{headset.name}: streaming at {headset.reader.fs} Hz -> '{headset.output}'")
+
+
+async def record(headset, start_time, poll_interval, stop_event):
+    while not stop_event.is_set() and not getattr(headset.board, 'finished', False):
+        await asyncio.to_thread(headset.drain, start_time)
+        try:
+            await asyncio.wait_for(stop_event.wait(), poll_interval)
+        except asyncio.TimeoutError:
+            pass
+    await asyncio.to_thread(headset.drain, start_time)  # whatever arrived after the last poll
+
+
+async def shutdown(headset):
+    await asyncio.to_thread(headset.board.stop_stream)
+    headset.close_writers()
+    samples = await asyncio.to_thread(finalize_session, headset.output, headset.board_id)
+    await asyncio.to_thread(headset.board.release_session)
+    return samples
+
+
+async def main_async(args):
+    boards = await discover_boards(args)
+    headsets = []
+    for i, (name, board, board_id) in enumerate(boards):
+        output = next_session_path(os.path.join(args.output_dir, f"headset_{i + 1}", "eeg_action_data_{}.csv"))
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+        headsets.append(Headset(name, board, board_id, output, args.chunk_rows, args.fsync_interval))
+
+    print(f"Connecting to {len(headsets)} headsets...")
+    await asyncio.gather(*(connect(headset) for headset in headsets))
+
+    start_time = time.time()
+    shared_labels = SharedLabels(headsets, start_time)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    listener = None
+    if args.duration:
+        loop.call_later(args.duration, stop_event.set)
+    else:
+        listener = start_keyboard(shared_labels, stop_event, loop)
+
+    wall_start = time.perf_counter()
+    try:
+        await asyncio.gather(*(record(headset, start_time, args.poll_interval, stop_event) for headset in headsets))
+    finally:
+        stop_event.set()
+        if listener is not None:
+            listener.stop()
+        wall_time = time.perf_counter() - wall_start
+        print("Stopping streams and merging sessions...")
+        results = await asyncio.gather(*(shutdown(headset) for headset in headsets), return_exceptions=True)
+
+    total = 0
+    for headset, result in zip(headsets, results):
+        if isinstance(result, Exception):
+            print(f"{headset.name}: failed to save ({result})")
+            continue
+        total += headset.reader.samples_read
+        print(f"{headset.name}: {headset.reader.summary()}, "
+              f"{headset.reader.samples_read / wall_time:.1f} samples/s, saved to '{headset.output}'")
+    print(f"{len(headsets)} headsets, {total} samples in {wall_time:.1f} s ({total / wall_time:.0f} samples/s total)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record several headsets at once while labeling actions from the keyboard")
+    parser.add_argument("--macs", nargs="*", default=None, help="MAC addresses to record (default: scan for every Ganglion)")
+    parser.add_argument("--serial-ports", nargs="*", default=None, help="one dongle port per MAC, leave out to use the computer's Bluetooth")
+    parser.add_argument("--scan-timeout", type=float, default=5.0, help="seconds to scan for Ganglions")
+    parser.add_argument("--synthetic", type=int, default=0, help="record this many BrainFlow synthetic boards instead")
+    parser.add_argument("--replay", nargs="*", default=None, help="replay these session CSVs as headsets instead")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1 = real time")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds instead of on ESC (no keyboard needed)")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="seconds between ring buffer drains")
+    parser.add_argument("--output-dir", default="eeg_sessions", help="each headset writes to <output-dir>/headset_<n>/")
+    parser.add_argument("--chunk-rows", type=int, default=2000, help="rows buffered in memory before they are appended to disk")
+    parser.add_argument("--fsync-interval", type=float, default=5.0, help="seconds between fsyncs of the partial recordings")
+    args = parser.parse_args()
+
+    BoardShim.disable_board_logger()
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        print("KeyboardInterrupt caught. Partial recordings can be rebuilt with eeg_recorder.py --recover")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
-import csv
+import argparse
+import os
 import time
 import threading
+import numpy as np
 from pynput import keyboard
-from brainflow.board_shim import BoardShim, BrainFlowInputParams, BoardIds
+from eeg_acquisition import create_board, BlockReader
+from eeg_recorder import ChunkedWriter, eeg_part_path, label_part_path, next_session_path, finalize_session
 
 #labels and associated numbers on keyboard
 labels = {
@@ -15,71 +18,85 @@ labels = {
 
 current_label = 'nothing'
 start_time = time.time()
-label_data = []  #for storing time and actions
-eeg_data = []  #to store voltages from EEG
+label_writer = None  #appends label changes (time, action) to disk as they happen
+label_lock = threading.Lock()  #keyboard listener and shutdown both write label events
+eeg_writer = None  #appends voltages from EEG to disk in chunks
 running = True
+poll_interval = 0.05  #seconds between ring buffer drains, every sample is kept whatever this is
 
 #BrainFlow setup based on documentation: https://brainflow.readthedocs.io/en/stable/SupportedBoards.html#ganglion
-params = BrainFlowInputParams()
-params.mac_address = "D5:A4:BE:DD:BC:89"  #this was recieved from using python libraries in the previous step file (s0) so device is instantly found
-params.serial_port = "COM5"  
-board = BoardShim(BoardIds.GANGLION_BOARD.value, params)
+#the MAC address was recieved from using python libraries in the previous step file (s0) so device is instantly found
+board = None
+reader = None
 
 # Function to update the current label based on keyboard input
 def on_press(key):
-    global current_label
     try:
         if key.char in labels:
-            current_label = labels[key.char]
+            set_label(labels[key.char])
     except AttributeError:
         pass
 
+#Record a label event only when the label actually changes
+def set_label(label):
+    global current_label
+    with label_lock:
+        if label == current_label:
+            return
+        current_label = label
+        elapsed_time = time.time() - start_time
+        label_writer.append([(elapsed_time, label)])
+    print(f"Time: {elapsed_time:.1f} s, Label: {label}") #.1f is a floating point to one decimal place
+
 #Stop on escape
 def on_release(key):
     if key == keyboard.Key.esc:
         # Stop listener
         return False
 
-#Timer to also record labels
-def record_labels():
-    global running 
-    while running:
-        elapsed_time = time.time() - start_time
-        label_data.append((elapsed_time, current_label))
-        print(f"Time: {elapsed_time:.1f} s, Label: {current_label}") #.1f is a floating point to one decimal place
-        time.sleep(0.1) #record every 0.1 seconds
-
 #record EEG data
+def drain_eeg():
+    block = reader.read()  # every sample since the last drain
+    if block.shape[1] == 0:
+        return
+    dropped_before = reader.dropped_packets
+    #time each sample with the board timestamp instead of when we happened to poll
+    elapsed_times = block[reader.timestamp_channel] - start_time
+    eeg_writer.append(np.column_stack((elapsed_times, block.T)).tolist())
+    if reader.dropped_packets > dropped_before:
+        print(f"Warning: {reader.dropped_packets - dropped_before} packets dropped ({reader.summary()})")
+
 def record_eeg():
     global running
     while running:
-        elapsed_time = time.time() - start_time
-        eeg_samples = board.get_current_board_data(1)  # Get the latest EEG sample
-        if eeg_samples.shape[1] > 0:  # Ensure data is available
-            eeg_sample = eeg_samples[:, -1]  # Latest sample
-            eeg_data.append((elapsed_time, *eeg_sample))
-        time.sleep(0.1)  # Match label sampling interval
-
-# Merge EEG data with labels based on timestamps
-def merge_data():
-    merged_data = []
-    for eeg_sample in eeg_data:
-        eeg_time = eeg_sample[0]
-        # Find the nearest label based on time
-        closest_label = min(label_data, key=lambda x: abs(x[0] - eeg_time)) #not all times are lined up cuz of time.time
-        merged_data.append((*eeg_sample, closest_label[1]))
-    return merged_data
-
-#CSV file
-def save_to_csv(filename, merged_data):
-    with open(filename, mode='w', newline='') as file:
-        writer = csv.writer(file)
-        # writer.writerow(['Time (s)', 'EEG_Ch1', 'EEG_Ch2', 'EEG_Ch3', 'EEG_Ch4', 'Label'])
-        writer.writerows(merged_data)
+        drain_eeg()
+        time.sleep(poll_interval)
+    drain_eeg()  # pick up whatever arrived after the last poll
 
 # Main function to start EEG and label recording
 def main():
-    global running
+    global running, board, reader, poll_interval, eeg_writer, label_writer
+    parser = argparse.ArgumentParser(description="Record EEG while labeling actions from the keyboard")
+    parser.add_argument("--synthetic", action="store_true", help="use BrainFlow's synthetic board instead of the Ganglion")
+    parser.add_argument("--poll-interval", type=float, default=poll_interval, help="seconds between ring buffer drains")
+    parser.add_argument("--output", default=None, help="session CSV to write (default: next free eeg_sessions/eeg_action_data_N.csv)")
+    parser.add_argument("--chunk-rows", type=int, default=2000, help="rows buffered in memory before they are appended to disk")
+    parser.add_argument("--fsync-interval", type=float, default=5.0, help="seconds between fsyncs of the partial recording")
+    args = parser.parse_args()
+
+    output = args.output or next_session_path()
+    if os.path.exists(eeg_part_path(output)):
+        raise SystemExit(f"A partial recording for {output} already exists, run 'python eeg_recorder.py --recover {output}' first")
+    eeg_writer = ChunkedWriter(eeg_part_path(output), args.chunk_rows, args.fsync_interval)
+    label_writer = ChunkedWriter(label_part_path(output), 1, args.fsync_interval)  #events are rare, write each one straight away
+    label_writer.append([(0.0, current_label)])
+    print(f"Recording to '{output}'")
+
+    poll_interval = args.poll_interval
+    board, board_id = create_board(synthetic=args.synthetic)
+    reader = BlockReader(board, board_id)
+    print(f"Sampling rate: {reader.fs} Hz, draining every {poll_interval} s")
+
     try:
         print("Preparing session...")
         board.prepare_session()
@@ -88,9 +105,7 @@ def main():
         board.start_stream()
 
         #use threading for least delay between collection of data
-        label_thread = threading.Thread(target=record_labels)
         eeg_thread = threading.Thread(target=record_eeg)
-        label_thread.start()
         eeg_thread.start()
 
         # Start listening for keyboard input in a non-blocking way
@@ -109,18 +124,19 @@ def main():
         # Ensure threads and board stream are stopped
         running = False
         listener.stop()
-        label_thread.join()
         eeg_thread.join()
 
         print("Stopping EEG data stream...")
         board.stop_stream()
+        print("Acquisition:", reader.summary())
+
+        eeg_writer.close()
+        label_writer.close()
 
         # Merge data and save to CSV
         print("Merging EEG data with labels...")
-        merged_data = merge_data()
-        save_to_csv('eeg_sessions/eeg_action_data_2.csv', merged_data) #change both of these lines
-        print("Data saved to 'eeg_action_data_2.csv'") #this one
-        print("change these file numbers now")
+        samples = finalize_session(output, board_id)
+        print(f"{samples} samples saved to '{output}'")
 
         print("Releasing session...")
         board.release_session()
@@ -1,42 +1,143 @@
+import argparse
+import hashlib
+import json
+import os
 import pandas as pd
-import glob
+from eeg_recorder import session_files
+
+"""
+Combines every session into one continuous recording, incrementally.
+
+eeg_sessions/catalog.json remembers, for every session already in
+combined_eeg_data_continuous.csv: its size, modification time and checksum,
+row count, the time offset it was shifted by, its last time, and the byte
+range it occupies in the combined file. On the next run every session that
+still matches its catalog entry is skipped without being read. Everything
+from the first new or changed session onwards is cut off the combined file
+and appended again, so adding a session only costs reading that session.
+"""
 
 #grab all csv files with data
 #glob library uses wildcard naming convention with *
 file_pattern = "eeg_sessions/eeg_action_data_*.csv"
-file_list = sorted(glob.glob(file_pattern))
-print("Found files:", file_list)
+catalog_path = "eeg_sessions/catalog.json"
+output_path = "combined_eeg_data_continuous.csv"
+
+
+def file_checksum(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def load_catalog():
+    if not os.path.exists(catalog_path):
+        return {'output': output_path, 'sessions': []}
+    with open(catalog_path) as file:
+        return json.load(file)
 
-eachEEG = []
-time_offset = 0.0
 
-for file in file_list:
+def save_catalog(catalog):
+    #write then rename so an interrupted run never leaves a half-written catalog
+    tmp_path = catalog_path + ".tmp"
+    with open(tmp_path, 'w') as file:
+        json.dump(catalog, file, indent=2)
+    os.replace(tmp_path, catalog_path)
+
+
+def is_unchanged(entry, file):
+    """Size and mtime are checked first so unchanged sessions are not even read for the checksum."""
+    if entry['file'] != file:
+        return False
+    stat = os.stat(file)
+    if stat.st_size != entry['size']:
+        return False
+    if stat.st_mtime == entry['mtime']:
+        return True
+    if file_checksum(file) == entry['sha1']:
+        entry['mtime'] = stat.st_mtime  # touched but not modified
+        return True
+    return False
+
+
+def append_session(file, time_offset, out):
+    """Shift one session onto the combined timeline and append it, returns its catalog entry."""
     #Read CSV without headers
     currentEEG = pd.read_csv(file, header=None)
-    
+
     #make first column time
     currentEEG[0] = pd.to_numeric(currentEEG[0], errors='coerce')
-    
+
     # Add the current offset to the time column
     currentEEG[0] += time_offset
-    
-    # Update the offset: get the maximum time value in this session for the next starting number for no overlap
-    session_max_time = currentEEG[0].max()
-    time_offset = session_max_time
-    
-    eachEEG.append(currentEEG)
 
-# Check that dataframes is not empty
-if not eachEEG:
-    raise ValueError("No files were found or no data was read.")
+    # Sessions are placed one after another, so sorting each one keeps the whole file in time order
+    currentEEG.sort_values(by=0, inplace=True, kind='stable')
+
+    byte_offset = out.tell()
+    currentEEG.to_csv(out, index=False, header=False)
+    stat = os.stat(file)
+    return {
+        'file': file,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'sha1': file_checksum(file),
+        'rows': len(currentEEG),
+        'time_offset': time_offset,
+        # the offset for the next session: the maximum time value in this one, for no overlap
+        'max_time': float(currentEEG[0].max()),
+        'byte_offset': byte_offset,
+        'byte_end': out.tell(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Combine all sessions into one continuous CSV")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the catalog and re-read every session")
+    args = parser.parse_args()
+
+    file_list = session_files(file_pattern)
+    print("Found files:", file_list)
+
+    # Check that there is something to combine
+    if not file_list:
+        raise ValueError("No files were found or no data was read.")
+
+    catalog = load_catalog()
+    cached = catalog['sessions']
+
+    #the combined file must be exactly what the catalog describes, otherwise start over
+    combined_size = os.path.getsize(output_path) if os.path.exists(output_path) else -1
+    expected_size = cached[-1]['byte_end'] if cached else 0
+    if args.rebuild or catalog.get('output') != output_path or combined_size != expected_size:
+        cached = []
+
+    # Keep the longest run of sessions that are still exactly as they were combined
+    keep = 0
+    while keep < min(len(cached), len(file_list)) and is_unchanged(cached[keep], file_list[keep]):
+        keep += 1
+    sessions = cached[:keep]
+    time_offset = sessions[-1]['max_time'] if sessions else 0.0
+    truncate_at = sessions[-1]['byte_end'] if sessions else 0
+
+    print(f"{keep} sessions unchanged, {len(file_list) - keep} to add")
+    mode = 'r+' if sessions else 'w'
+    with open(output_path, mode, newline='') as out:
+        out.seek(truncate_at)
+        out.truncate()
+        for file in file_list[keep:]:
+            entry = append_session(file, time_offset, out)
+            time_offset = entry['max_time']
+            sessions.append(entry)
+            print(f"Added {file}: {entry['rows']} rows, time offset {entry['time_offset']:.2f} s")
 
-# Concatenate all DataFrames into one continuous DataFrame, ignores the index when concatenating
-allEEG = pd.concat(eachEEG, ignore_index=True)
+    catalog = {'output': output_path, 'sessions': sessions}
+    save_catalog(catalog)
 
-# Optionally, sort by time (should be already in order)
-allEEG.sort_values(by=0, inplace=True)
+    print(f"All sessions have been combined into '{output_path}' with continuous time.")
 
-# Save the combined DataFrame to a new CSV file without headers (if desired)
-allEEG.to_csv("combined_eeg_data_continuous.csv", index=False, header=False)
 
-print("All sessions have been combined into 'combined_eeg_data_continuous.csv' with continuous time.")
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,127 @@
+import argparse
+import os
+import shutil
+import numpy as np
 import pandas as pd
-import glob
+from concurrent.futures import ProcessPoolExecutor
+from eeg_recorder import session_files
+
+"""
+Combines sessions and rescales each one to the first session's baseline,
+without ever loading a whole session.
+
+Pass 1 runs one process per session: it reads the session in chunks and
+keeps running (Welford) mean/variance per channel plus the session's last
+time. Pass 2 also runs one process per session: it shifts the time column by
+the offset worked out from pass 1, rescales the channels chunk by chunk and
+writes a part file. The parts are then appended in order into the combined
+CSV. Peak memory is a few chunks per worker and wall time scales with cores.
+"""
 
 ######################################
 # Step 1: Combine and Normalize Files
 ######################################
 
 # Adjust the pattern to match your CSV files
-file_pattern = "eeg_action_data_*.csv"
-file_list = sorted(glob.glob(file_pattern))
-print("Found files:", file_list)
-
-if not file_list:
-    raise ValueError("No files found matching the pattern.")
-
-dataframes = []
-time_offset = 0.0
+file_pattern = "eeg_sessions/eeg_action_data_*.csv"
+combined_output_filename = "combined_eeg_data_continuous.csv"
 
 # In the combined data, we assume the columns are:
 # Index 0: Time, 1: Marker, 2: EEG_Ch1, 3: EEG_Ch2, 4: EEG_Ch3, 5: EEG_Ch4, ...
 # We'll normalize EEG channels (columns 2-5) across sessions.
 channels_to_normalize = [2, 3, 4, 5]
 
-# --- Process the baseline file (first file) ---
-baseline_df = pd.read_csv(file_list[0], header=None)
-baseline_df[0] = pd.to_numeric(baseline_df[0], errors='coerce')
-baseline_df[0] += time_offset
-time_offset = baseline_df[0].max()
-
-# Compute baseline statistics for the EEG channels
-baseline_means = baseline_df[channels_to_normalize].mean()
-baseline_stds = baseline_df[channels_to_normalize].std()
-
-# Append the baseline (no change needed)
-dataframes.append(baseline_df)
-
-# --- Process subsequent files (new sessions) ---
-for file in file_list[1:]:
-    df = pd.read_csv(file, header=None)
-    df[0] = pd.to_numeric(df[0], errors='coerce')
-    df[0] += time_offset
-    time_offset = df[0].max()
-    
-    # Compute current file statistics for EEG channels
-    new_means = df[channels_to_normalize].mean()
-    new_stds = df[channels_to_normalize].std()
-    
-    # Normalize each EEG channel so that its distribution matches the baseline
-    for col in channels_to_normalize:
-        df[col] = ((df[col] - new_means[col]) / new_stds[col]) * baseline_stds[col] + baseline_means[col]
-    
-    dataframes.append(df)
-
-# Concatenate all sessions into one continuous DataFrame
-combined_df = pd.concat(dataframes, ignore_index=True)
-combined_df.sort_values(by=0, inplace=True)
-
-# Save combined data (without headers) to a CSV file
-combined_output_filename = "combined_eeg_data_continuous.csv"
-combined_df.to_csv(combined_output_filename, index=False, header=False)
-print(f"Combined normalized data saved to '{combined_output_filename}'")
+
+def merge_stats(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """Combine two sets of running statistics (Chan et al.'s parallel form of Welford's update)."""
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, mean_a + delta * count_b / count, 0.0)
+        m2 = np.where(count > 0, m2_a + m2_b + delta ** 2 * count_a * count_b / count, 0.0)
+    return count, mean, m2
+
+
+def session_stats(file, chunk_rows):
+    """Pass 1 worker: per-channel count/mean/M2 and the last time of one session."""
+    n_channels = len(channels_to_normalize)
+    count = np.zeros(n_channels)
+    mean = np.zeros(n_channels)
+    m2 = np.zeros(n_channels)
+    max_time = -np.inf
+    for chunk in pd.read_csv(file, header=None, chunksize=chunk_rows):
+        max_time = max(max_time, pd.to_numeric(chunk[0], errors='coerce').max())
+        values = chunk[channels_to_normalize].to_numpy(dtype=float)
+        valid = ~np.isnan(values)  # like pandas mean()/std(), missing values are skipped
+        chunk_count = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            chunk_mean = np.where(chunk_count > 0, np.nansum(values, axis=0) / chunk_count, 0.0)
+        chunk_m2 = np.nansum((values - chunk_mean) ** 2, axis=0)
+        count, mean, m2 = merge_stats(count, mean, m2, chunk_count, chunk_mean, chunk_m2)
+    return count, mean, m2, max_time
+
+
+def rescale_session(file, part_path, time_offset, scale, shift, chunk_rows):
+    """Pass 2 worker: offset time, rescale channels and write one session's part file."""
+    with open(part_path, 'w', newline='') as out:
+        for chunk in pd.read_csv(file, header=None, chunksize=chunk_rows):
+            chunk[0] = pd.to_numeric(chunk[0], errors='coerce') + time_offset
+            chunk[channels_to_normalize] = chunk[channels_to_normalize].to_numpy(dtype=float) * scale + shift
+            chunk.to_csv(out, index=False, header=False)
+    return part_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Combine sessions, normalizing each to the first session's baseline")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use (default: one per core)")
+    parser.add_argument("--chunk-rows", type=int, default=50000, help="rows read at a time per session")
+    args = parser.parse_args()
+
+    file_list = session_files(file_pattern)
+    print("Found files:", file_list)
+
+    if not file_list:
+        raise ValueError("No files found matching the pattern.")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # --- Pass 1: statistics for every session in parallel ---
+        stats = list(pool.map(session_stats, file_list, [args.chunk_rows] * len(file_list)))
+
+        # Compute baseline statistics for the EEG channels (the first file)
+        base_count, base_mean, base_m2, _ = stats[0]
+        baseline_means = base_mean
+        baseline_stds = np.sqrt(base_m2 / (base_count - 1))  # sample std, like pandas
+
+        # Each session starts where the previous one ended so the times don't overlap
+        time_offsets = []
+        time_offset = 0.0
+        for count, mean, m2, max_time in stats:
+            time_offsets.append(time_offset)
+            time_offset = max_time + time_offset
+
+        # --- Pass 2: rescale every session in parallel ---
+        # ((x - new_mean) / new_std) * baseline_std + baseline_mean, folded into x * scale + shift.
+        # The baseline (first file) is left unchanged.
+        futures = []
+        for i, (file, (count, mean, m2, _)) in enumerate(zip(file_list, stats)):
+            if i == 0:
+                scale, shift = np.ones_like(mean), np.zeros_like(mean)
+            else:
+                new_stds = np.sqrt(m2 / (count - 1))
+                scale = baseline_stds / new_stds
+                shift = baseline_means - mean * scale
+            part_path = f"{combined_output_filename}.part{i}"
+            futures.append(pool.submit(rescale_session, file, part_path, time_offsets[i], scale, shift, args.chunk_rows))
+        part_paths = [future.result() for future in futures]
+
+    # Concatenate all sessions into one continuous file, in session order
+    with open(combined_output_filename, 'wb') as out:
+        for part_path in part_paths:
+            with open(part_path, 'rb') as part:
+                shutil.copyfileobj(part, out)
+            os.remove(part_path)
+    print(f"Combined normalized data saved to '{combined_output_filename}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
+import argparse
+import itertools
+import json
+import numpy as np
 import pandas as pd
 
-# gives digital filters
-from scipy.signal import butter, filtfilt, iirnotch
+# gives digital filters, designed once and applied to all channels together
+from eeg_filters import FilterBank, zero_phase_blocks
+from eeg_epoching import session_rows
+from eeg_resample import resample_frame, split_sessions
 
 """
 butter: butterworth band-pass filter: throw everything out around wanted frequency range
@@ -11,21 +17,31 @@ include nyquist frequency to not mislabel fast waves as slow waves due to aliasi
 aliasing: sampling illusion
 """
 
-filename = 'combined_eeg_data_continuous.csv' 
-combined_eeg = pd.read_csv(filename, header = None)
+parser = argparse.ArgumentParser(description="Bandpass filter the combined EEG recording")
+parser.add_argument("--causal", action="store_true",
+                    help="filter forwards only, exactly like the live scripts do, instead of zero-phase")
+parser.add_argument("--chunked", action="store_true",
+                    help="filter block by block and write as it goes, for recordings too big for memory "
+                         "(rows as stored, no resampling, so not with --fs)")
+parser.add_argument("--block-size", type=int, default=60000, help="samples per block with --chunked")
+parser.add_argument("--fs", type=float, default=None,
+                    help="resample to this rate before filtering, e.g. 100 for cheaper models (default: the board rate). "
+                         "It must divide the board rate, the live scripts decimate the stream to it")
+parser.add_argument("--max-gap", type=float, default=0.25,
+                    help="seconds between rows that count as a gap, segments are never filtered across gaps")
+parser.add_argument("--no-resample", action="store_true", help="filter the rows as they are, without the uniform grid")
+args = parser.parse_args()
 
-print("Data preview:")
-print(combined_eeg.head())
-
-# Assign proper column names, learned from OpenBCI 
-combined_eeg.columns = [
-    'Time', 'Marker', 'EEG_Ch1', 'EEG_Ch2', 'EEG_Ch3', 'EEG_Ch4', 
-    'Aux1', 'Aux2', 'Aux3', 'Aux4', 'Other1', 'Other2', 'Other3', 'Other4', 'Epoch', 'Other', 'Label'
-]
+filename = 'combined_eeg_data_continuous.csv'
+output_filename = 'filtered_eeg_action_data.csv'
+settings_filename = 'filtered_eeg_action_data.json'  # the filter settings, copied into model bundles by the trainers
 
-# Print to verify corrected column alignment
-print("\nCorrected Data Preview:")
-print(combined_eeg.head())
+# Column names learned from OpenBCI, the combined file has no header:
+# 'Time', 'Marker', 'EEG_Ch1', 'EEG_Ch2', 'EEG_Ch3', 'EEG_Ch4',
+# 'Aux1', 'Aux2', 'Aux3', 'Aux4', 'Other1', 'Other2', 'Other3', 'Other4', 'Epoch', 'Other', 'Label'
+# Only Time, Channels 1-4 and Labels are used, so only those are read.
+relevant_columns = [0, 2, 3, 4, 5, 16]
+relevant_names = ['Time', 'Channel 1', 'Channel 2', 'Channel 3', 'Channel 4', 'Label']
 
 """
 Currently using four electrodes:
@@ -35,56 +51,209 @@ Channel 3: below right eye
 Channel 4: above right eye
 """
 
-# Extract relevant columns: Time, Channels 1-4, Labels
-relevant_data = combined_eeg[['Time', 'EEG_Ch1', 'EEG_Ch2', 'EEG_Ch3', 'EEG_Ch4', 'Label']]
-
-# Rename columns
-relevant_data.columns = ['Time', 'Channel 1', 'Channel 2', 'Channel 3', 'Channel 4', 'Label']
-
-print("got relevant columns")
-
-# Define the bandpass filter
+# The bandpass filter
 """
 -Allows frequencies within a certain range to pass through
 -Helps remove motion artifacts or EMG noise
 -0.5-50 Hz
 """
-def bandpass_filter(data, lowcut, highcut, fs, order=4):
-    nyquist = 0.5 * fs  # Nyquist frequency
-    low = lowcut / nyquist
-    high = highcut / nyquist
-    b, a = butter(order, [low, high], btype='band')
-    return filtfilt(b, a, data)
-
-# Define the notch filter
+
+# The notch filter
 """
 -removes a certain frequency
 -can be used to remove powerline interference
-(not using for now)
+(not using for now, set notch_freq to add it to the same cascade)
 """
-def notch_filter(data, notch_freq, fs, quality=30):
-    nyquist = 0.5 * fs
-    freq = notch_freq / nyquist
-    b, a = iirnotch(freq, quality)
-    return filtfilt(b, a, data)
 
 #Sampling rate
-fs = 200  # OpenBCI Ganglion sampling rate
+board_fs = 200  # OpenBCI Ganglion sampling rate
+fs = args.fs or board_fs  # rate of the uniform grid the data is resampled to
+if (board_fs / fs) % 1 or fs > board_fs:
+    parser.error(f"--fs must divide the board rate ({board_fs} Hz), e.g. 100 or 50, so the live scripts can decimate to it")
+if args.fs and args.no_resample:
+    parser.error("--fs needs the resampling step, drop --no-resample")
+if args.fs and args.chunked:
+    parser.error("--chunked filters the rows at the board rate as stored, it can't resample to --fs")
 
 #Bandpass filter settings
 lowcut = 0.5  # Low cutoff frequency (Hz)
 highcut = 50  # High cutoff frequency (Hz)
 
 # Notch filter settings
-# notch_freq = 60  # Notch filter frequency (Hz)
+notch_freq = None  # Notch filter frequency (Hz), e.g. 60
 
-relevant_data['Filtered Channel 1'] = bandpass_filter(relevant_data['Channel 1'], lowcut, highcut, fs)
-relevant_data['Filtered Channel 2'] = bandpass_filter(relevant_data['Channel 2'], lowcut, highcut, fs)
-relevant_data['Filtered Channel 3'] = bandpass_filter(relevant_data['Channel 3'], lowcut, highcut, fs)
-relevant_data['Filtered Channel 4'] = bandpass_filter(relevant_data['Channel 4'], lowcut, highcut, fs)
+# float32 halves memory and speeds up very long recordings, float64 matches the old filtfilt output
+filter_dtype = 'float64'
 
-# Save the filtered data to a new CSV file
-output_filename = 'filtered_eeg_action_data.csv'
-relevant_data.to_csv(output_filename, index=False)
+# the bandpass has to stay below Nyquist when resampling to a lower rate
+if highcut >= 0.5 * fs:
+    highcut = 0.45 * fs
+    print(f"Lowering the bandpass high cutoff to {highcut} Hz for fs = {fs} Hz")
+
+channel_cols = ['Channel 1', 'Channel 2', 'Channel 3', 'Channel 4']
+
+
+def read_relevant(**kwargs):
+    return pd.read_csv(filename, header=None, usecols=relevant_columns, names=relevant_names, **kwargs)
+
+
+def segment_pieces(session_starts):
+    """
+    Read block_size rows at a time and split them into (segment, rows) pieces
+    like the default path's segments: a new one at every session join (rows
+    in session_starts, or where the time goes backwards without a catalog)
+    and wherever two rows are more than max_gap apart.
+    """
+    segment = -1
+    last_time = None
+    row = 0
+    for chunk in read_relevant(chunksize=args.block_size):
+        times = chunk['Time'].to_numpy(dtype=float)
+        steps = np.diff(times, prepend=times[0] if last_time is None else last_time)
+        new = (steps < 0) | (steps > args.max_gap) | np.isin(row + np.arange(len(chunk)), session_starts)
+        if last_time is None:
+            new[0] = True
+        bounds = list(np.nonzero(new)[0]) + [len(chunk)]
+        if bounds[0] != 0:
+            bounds.insert(0, 0)  # the chunk continues the previous segment
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if new[start]:
+                segment += 1
+            yield segment, chunk.iloc[start:end]
+        last_time = times[-1]
+        row += len(chunk)
+
+
+def filter_segment(segment, pieces, out, header):
+    """
+    Filter one segment's pieces with a fresh filter, with enough overlap on both
+    sides (zero_phase_blocks), and append each finished block to out.
+    Returns the rows written, 0 for a segment too short to filter.
+    """
+    filter_bank = FilterBank(board_fs, (lowcut, highcut), order=4, notch_freq=notch_freq, dtype=filter_dtype)
+    min_segment = int(board_fs)  # shorter segments are too short to filter and are dropped, like the default path
+    #hold back the start of the segment until it's known to be long enough
+    head = []
+    for piece in pieces:
+        head.append(piece)
+        if sum(len(rows) for rows in head) >= min_segment:
+            break
+    if sum(len(rows) for rows in head) < min_segment:
+        print(f"Dropping segment {segment}: only {sum(len(rows) for rows in head)} samples")
+        return 0
+    pending = []  # unfiltered rows waiting for their filtered values, in order
+
+    def channel_chunks():
+        for rows in itertools.chain(head, pieces):
+            pending.append(rows)
+            yield rows[channel_cols].to_numpy()
+
+    if args.causal:
+        stream_filter = filter_bank.streaming()
+        filtered_blocks = (stream_filter.process(block) for block in channel_chunks())
+    else:
+        filtered_blocks = zero_phase_blocks(channel_chunks(), filter_bank, args.block_size)
+
+    written = 0
+    for filtered in filtered_blocks:
+        #take exactly as many unfiltered rows as this block has filtered samples
+        block = pd.concat(pending, ignore_index=True)
+        block, rest = block.iloc[:len(filtered)].copy(), block.iloc[len(filtered):]
+        pending[:] = [rest] if len(rest) else []
+        block['Segment'] = segment
+        for i, col in enumerate(channel_cols):
+            block['Filtered ' + col] = filtered[:, i]
+        block.to_csv(out, index=False, header=header and written == 0)
+        written += len(block)
+    return written
+
+
+def filter_chunked():
+    """
+    Filter the recording segment by segment, block_size rows at a time,
+    so memory stays bounded by the block size however long the recording
+    is. The rows are filtered as stored (no resampling), which is right for
+    sessions recorded with s1's uniform sample clock. Filters restart at
+    session joins and gaps like in the default path.
+    """
+    #one cheap pass to count rows, so s2's catalog can say where sessions join
+    with open(filename) as file:
+        n_rows = sum(1 for _ in file)
+    sessions = session_rows(n_rows)
+    if sessions is None:
+        print("No s2 catalog matching this file, splitting sessions where the time goes backwards")
+        session_starts = np.array([], dtype=int)
+    else:
+        session_starts = np.nonzero(np.diff(sessions))[0] + 1
+
+    rows = 0
+    with open(output_filename, 'w', newline='') as out:
+        for segment, pieces in itertools.groupby(segment_pieces(session_starts), key=lambda item: item[0]):
+            rows += filter_segment(segment, (piece for _, piece in pieces), out, header=(rows == 0))
+            print(f"Filtered {rows} samples")
+
+
+if args.chunked:
+    if not args.no_resample:
+        print("--chunked filters the rows as stored, resampling is skipped")
+    filter_chunked()
+else:
+    relevant_data = read_relevant()
+
+    print("Data preview:")
+    print(relevant_data.head())
+
+    print("got relevant columns")
+
+    # Where each recorded session starts, from the row counts in s2's catalog, so no filter runs across a join
+    sessions = session_rows(len(relevant_data))
+    if sessions is None:
+        print("No s2 catalog matching this file, splitting sessions where the time goes backwards")
+
+    # Put every segment on an exact uniform grid at fs, splitting at sessions and wherever rows are more than max_gap apart
+    if args.no_resample:
+        relevant_data['Segment'] = 0
+        for segment, (start, end) in enumerate(split_sessions(relevant_data['Time'].to_numpy(), sessions)):
+            relevant_data.iloc[start:end, relevant_data.columns.get_loc('Segment')] = segment
+    else:
+        # --causal decimates with the live scripts' causal anti-aliasing filter instead of the zero-phase resample_poly
+        relevant_data = resample_frame(relevant_data, channel_cols, grid_fs=board_fs, target_fs=fs,
+                                       max_gap=args.max_gap, sessions=sessions, causal=args.causal)
+        print(f"Resampled to {fs} Hz: {len(relevant_data)} samples in {relevant_data['Segment'].nunique()} gap-free segments")
+
+    filter_bank = FilterBank(fs, (lowcut, highcut), order=4, notch_freq=notch_freq, dtype=filter_dtype)
+
+    # Filter each segment on its own so the filters never run across a gap,
+    # all four channels in one pass over a (samples, channels) array.
+    # --causal uses the streaming filter from the live scripts so models trained on it see the same preprocessing live
+    min_segment = int(fs)  # shorter segments are too short to filter and are dropped
+    segments = []
+    for segment, rows in relevant_data.groupby('Segment', sort=False):
+        if len(rows) < min_segment:
+            print(f"Dropping segment {segment}: only {len(rows)} samples")
+            continue
+        if args.causal:
+            filtered = filter_bank.streaming().process(rows[channel_cols].to_numpy())
+        else:
+            filtered = filter_bank.apply(rows[channel_cols].to_numpy(), axis=0)
+        rows = rows.copy()
+        for i, col in enumerate(channel_cols):
+            rows['Filtered ' + col] = filtered[:, i]
+        segments.append(rows)
+    relevant_data = pd.concat(segments, ignore_index=True)
+
+    # Save the filtered data to a new CSV file
+    relevant_data.to_csv(output_filename, index=False)
+
+# Record how the data was filtered, so models trained on it filter live data the same way
+with open(settings_filename, 'w') as f:
+    json.dump({
+        'fs': board_fs if args.chunked else fs,
+        'band': [lowcut, highcut],
+        'order': 4,
+        'notch_freq': notch_freq,
+        'causal': args.causal,
+        'resampled': not (args.chunked or args.no_resample),
+    }, f, indent=2)
 
 print(f"Filtered data saved to '{output_filename}'")
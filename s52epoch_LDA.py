@@ -1,54 +1,43 @@
-import pandas as pd
 import numpy as np
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
 from sklearn.preprocessing import LabelEncoder
-import joblib
+from eeg_epoching import load_signal, window_starts, describe
+from eeg_features import DEFAULT_CONFIG, cached_features
+from eeg_bundle import save_bundle, read_preprocessing
 
 # ----------------------------
 # 1. Load and Epoch the Data
 # ----------------------------
 
-# Load the CSV file
-data = pd.read_csv('filtered_eeg_action_data.csv')
+# Load the filtered channels the features use as one (samples, channels) array
+feature_cols = ['Filtered Channel 2', 'Filtered Channel 4']
+signal, label_codes, label_names, segments, fs = load_signal('filtered_eeg_action_data.csv', feature_cols)
 
-# Rebase time so that the first timestamp is zero.
-data['Time_Relative'] = data['Time (s)'] - data['Time (s)'].min()
-
-# Define the epoch length (in seconds)
+# Define the epoch length and the step between epoch starts (in seconds), equal for non-overlapping epochs
 epoch_length = 2.0
+epoch_hop = 2.0
+samples_per_epoch = int(epoch_length * fs)  # fs is the rate s3 resampled the data to
+samples_per_hop = int(epoch_hop * fs)
 
-# Create an epoch index by floor dividing the relative time by the epoch length
-data['Epoch_Index'] = (data['Time_Relative'] // epoch_length).astype(int)
-
-# Group the data by epoch
-epochs = data.groupby('Epoch_Index')
+# Only epochs with a consistent label are used: windows are laid inside each run of one label
+# within one gap-free segment from s3, so no epoch mixes labels or spans a gap
+starts, window_codes = window_starts(label_codes, samples_per_epoch, samples_per_hop, segments)
+print(f"{len(starts)} epochs ({describe(window_codes, label_names)})")
 
 # ----------------------------
 # 2. Feature Extraction per Epoch
 # ----------------------------
-# We will only use epochs with a consistent label.
-# For each epoch, we compute the mean and standard deviation for 'Filtered Channel 2' and 'Filtered Channel 4'.
-
-features = []
-labels = []
-for epoch_idx, group in epochs:
-    unique_labels = group['Label'].unique()
-    if len(unique_labels) == 1:
-        # Compute features: mean and std of each channel.
-        f_chan2_mean = group['Filtered Channel 2'].mean()
-        f_chan2_std = group['Filtered Channel 2'].std()
-        f_chan4_mean = group['Filtered Channel 4'].mean()
-        f_chan4_std = group['Filtered Channel 4'].std()
-        feature_vector = [f_chan2_mean, f_chan2_std, f_chan4_mean, f_chan4_std]
-        features.append(feature_vector)
-        labels.append(unique_labels[0])
-    else:
-        print(f"Epoch {epoch_idx} discarded: multiple labels found {unique_labels}")
+# For each epoch, compute mean/std, band powers, Hjorth parameters, peak-to-peak and the channel covariance
+# of 'Filtered Channel 2' and 'Filtered Channel 4', all epochs at once (see eeg_features.py).
+# The features are cached on disk, so retraining on the same data and epochs skips this step.
+feature_config = DEFAULT_CONFIG
+features = cached_features(signal, starts, samples_per_epoch, fs, feature_config)
+labels = label_names[window_codes]
 
-X = np.array(features)
-y = np.array(labels)
+X = features
+y = labels
 
 print("Feature matrix shape:", X.shape)
 print("Unique labels:", np.unique(y))
@@ -79,7 +68,7 @@ print(f"LDA Accuracy: {accuracy:.2f}")
 # 5. Save the Model for Live Classification
 # ----------------------------
 
-# Save both the LDA model and the label encoder for later use
-model_data = {'model': lda, 'label_encoder': le}
-joblib.dump(model_data, 'lda_model.joblib')
-print("LDA model saved to 'lda_model.joblib'")
+# Save the LDA model with everything the live scripts need (label order, channels, epoch length,
+# filter and feature settings) as a model bundle
+save_bundle('lda_bundle', lda, le.classes_, feature_cols, fs, epoch_length, epoch_hop,
+            read_preprocessing('filtered_eeg_action_data.csv'), feature_config)
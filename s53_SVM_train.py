@@ -1,54 +1,66 @@
-import pandas as pd
+import argparse
+import time
 import numpy as np
-from sklearn.svm import SVC
-from sklearn.model_selection import train_test_split
+from sklearn.svm import SVC, LinearSVC
+from sklearn.linear_model import SGDClassifier
+from sklearn.kernel_approximation import Nystroem, RBFSampler
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.frozen import FrozenEstimator  # scikit-learn >= 1.6
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import StandardScaler
+from sklearn.model_selection import train_test_split, PredefinedSplit
 from sklearn.metrics import accuracy_score
 from sklearn.preprocessing import LabelEncoder
-import joblib
+from eeg_epoching import load_signal, window_starts, describe
+from eeg_features import DEFAULT_CONFIG, cached_features
+from eeg_bundle import save_bundle, read_preprocessing
+from eeg_linear import CompactLinearSVM
+
+parser = argparse.ArgumentParser(description="Train the SVM on epoch features")
+parser.add_argument("--solver", choices=['linear', 'sgd', 'svc'], default='linear',
+                    help="linear: liblinear LinearSVC, sgd: SGDClassifier with hinge loss, "
+                         "svc: the old SVC(kernel='linear', probability=True) for comparison")
+parser.add_argument("--kernel-approx", choices=['none', 'nystroem', 'rff'], default='none',
+                    help="map the features through an approximate RBF kernel (Nystroem or random Fourier features) "
+                         "so the linear solver can learn non-linear boundaries")
+parser.add_argument("--n-components", type=int, default=300, help="size of the approximate kernel feature map")
+parser.add_argument("--gamma", type=float, default=None, help="RBF kernel width (default: 1 / number of features)")
+parser.add_argument("--C", type=float, default=1.0, help="regularization of the linear solvers")
+parser.add_argument("--calibration-size", type=float, default=0.2,
+                    help="share of the training epochs held out to calibrate probabilities once")
+args = parser.parse_args()
 
 # ----------------------------
 # 1. Load and Epoch the Data
 # ----------------------------
 
-# Load the CSV file
-data = pd.read_csv('filtered_eeg_action_data.csv')
+# Load the filtered channels the features use as one (samples, channels) array
+feature_cols = ['Filtered Channel 2', 'Filtered Channel 4']
+signal, label_codes, label_names, segments, fs = load_signal('filtered_eeg_action_data.csv', feature_cols)
 
-# Rebase time so that the first timestamp is zero.
-data['Time_Relative'] = data['Time (s)'] - data['Time (s)'].min()
-
-# Define the epoch length (in seconds)
+# Define the epoch length and the step between epoch starts (in seconds), equal for non-overlapping epochs
 epoch_length = 2.0
+epoch_hop = 2.0
+samples_per_epoch = int(epoch_length * fs)  # fs is the rate s3 resampled the data to
+samples_per_hop = int(epoch_hop * fs)
 
-# Create an epoch index by floor dividing the relative time by the epoch length
-data['Epoch_Index'] = (data['Time_Relative'] // epoch_length).astype(int)
-
-# Group the data by epoch
-epochs = data.groupby('Epoch_Index')
+# Only epochs with a consistent label are used: windows are laid inside each run of one label
+# within one gap-free segment from s3, so no epoch mixes labels or spans a gap
+starts, window_codes = window_starts(label_codes, samples_per_epoch, samples_per_hop, segments)
+print(f"{len(starts)} epochs ({describe(window_codes, label_names)})")
 
 # ----------------------------
 # 2. Feature Extraction per Epoch
 # ----------------------------
-# We will only use epochs with a consistent label.
-# For each epoch, compute the mean and standard deviation for 'Filtered Channel 2' and 'Filtered Channel 4'.
-
-features = []
-labels = []
-for epoch_idx, group in epochs:
-    unique_labels = group['Label'].unique()
-    if len(unique_labels) == 1:
-        # Compute features: mean and std of each channel.
-        f_chan2_mean = group['Filtered Channel 2'].mean()
-        f_chan2_std = group['Filtered Channel 2'].std()
-        f_chan4_mean = group['Filtered Channel 4'].mean()
-        f_chan4_std = group['Filtered Channel 4'].std()
-        feature_vector = [f_chan2_mean, f_chan2_std, f_chan4_mean, f_chan4_std]
-        features.append(feature_vector)
-        labels.append(unique_labels[0])
-    else:
-        print(f"Epoch {epoch_idx} discarded: multiple labels found {unique_labels}")
+# For each epoch, compute mean/std, band powers, Hjorth parameters, peak-to-peak and the channel covariance
+# of 'Filtered Channel 2' and 'Filtered Channel 4', all epochs at once (see eeg_features.py).
+# The features are cached on disk, so retraining on the same data and epochs skips this step.
+feature_config = DEFAULT_CONFIG
+features = cached_features(signal, starts, samples_per_epoch, fs, feature_config)
+labels = label_names[window_codes]
 
-X = np.array(features)
-y = np.array(labels)
+X = features
+y = labels
 
 print("Feature matrix shape:", X.shape)
 print("Unique labels:", np.unique(y))
@@ -67,20 +79,59 @@ X_train, X_test, y_train, y_test = train_test_split(X, y_encoded, test_size=0.2,
 # ----------------------------
 # 4. Train the SVM Model
 # ----------------------------
-# Here we use a linear kernel SVM for simplicity.
-svm = SVC(kernel='linear', probability=True)
-svm.fit(X_train, y_train)
+# SVC(probability=True) costs O(n^2)-O(n^3) in the number of epochs and refits five times for its internal
+# Platt calibration. The linear solvers scale linearly with the number of epochs; their probabilities are
+# calibrated once, on epochs held out from training.
+gamma = args.gamma or 1.0 / X.shape[1]
+steps = [StandardScaler()]  # the features have very different scales (log powers, variances, covariances)
+if args.kernel_approx == 'nystroem':
+    steps.append(Nystroem(kernel='rbf', gamma=gamma, n_components=min(args.n_components, len(X_train)), random_state=42))
+elif args.kernel_approx == 'rff':
+    steps.append(RBFSampler(gamma=gamma, n_components=args.n_components, random_state=42))
+
+start = time.perf_counter()
+if args.solver == 'svc':
+    # Here we use a linear kernel SVM for simplicity.
+    svm = make_pipeline(*steps, SVC(kernel='linear', probability=True))
+    svm.fit(X_train, y_train)
+else:
+    if args.solver == 'linear':
+        classifier = LinearSVC(C=args.C)
+    else:
+        classifier = SGDClassifier(loss='hinge', alpha=1.0 / (args.C * len(X_train)), random_state=42)
+    X_fit, X_calib, y_fit, y_calib = train_test_split(X_train, y_train, test_size=args.calibration_size,
+                                                      random_state=42, stratify=y_train)
+    base = make_pipeline(*steps, classifier).fit(X_fit, y_fit)
+    # the fitted model is frozen, and a single split with every held-out epoch in the test fold
+    # fits the sigmoid once on all of them (no refitting, no cross-validation)
+    svm = CalibratedClassifierCV(FrozenEstimator(base), method='sigmoid', cv=PredefinedSplit(np.zeros(len(y_calib))))
+    svm.fit(X_calib, y_calib)
+    # the same model as plain numpy arrays, much faster for one window at a time
+    compact = CompactLinearSVM(svm)
+    if not np.allclose(compact.predict_proba(X_test), svm.predict_proba(X_test)):
+        raise RuntimeError("The compact copy of the calibrated SVM doesn't reproduce its probabilities, not saving it")
+    svm = compact
+print(f"Training took {time.perf_counter() - start:.3f} s on {len(X_train)} epochs")
 
 # Evaluate the model
 y_pred = svm.predict(X_test)
 accuracy = accuracy_score(y_test, y_pred)
 print(f"SVM Accuracy: {accuracy:.2f}")
 
+# Latency of one live prediction (a single feature vector), like the live scripts make every window
+window_features = X_test[:1]
+svm.predict_proba(window_features)
+repeats = 200
+start = time.perf_counter()
+for _ in range(repeats):
+    svm.predict_proba(window_features)
+print(f"Per-window prediction latency: {(time.perf_counter() - start) / repeats * 1000:.3f} ms")
+
 # ----------------------------
 # 5. Save the Model for Live Classification
 # ----------------------------
 
-# Save both the SVM model and the label encoder for later use
-model_data = {'model': svm, 'label_encoder': le}
-joblib.dump(model_data, 'svm_model.joblib')
-print("SVM model saved to 'svm_model.joblib'")
+# Save the SVM model with everything the live scripts need (label order, channels, epoch length,
+# filter and feature settings) as a model bundle
+save_bundle('svm_bundle', svm, le.classes_, feature_cols, fs, epoch_length, epoch_hop,
+            read_preprocessing('filtered_eeg_action_data.csv'), feature_config)
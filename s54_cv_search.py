@@ -0,0 +1,174 @@
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.model_selection import GroupKFold
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+from sklearn.svm import LinearSVC
+from eeg_epoching import load_signal, session_ids, window_starts, describe
+from eeg_features import DEFAULT_CONFIG, DEFAULT_BANDS, cached_features, feature_names
+from eeg_bundle import save_bundle, read_preprocessing
+
+"""
+Model selection for the LDA/SVM models with grouped k-fold cross-validation
+instead of one train_test_split.
+
+- Folds are grouped by recording session (from s2's catalog), so a model is
+  always scored on sessions it never saw. Without a catalog the recording is
+  cut into contiguous time blocks instead, which still keeps overlapping or
+  neighbouring epochs out of each other's folds.
+- For every epoch length the full feature matrix (all bands and feature
+  groups) is computed once into features_cache/ as a .npy file. Workers open
+  it memory-mapped and pick the columns their band choice needs, so the
+  matrix is shared through the page cache instead of pickled to each process.
+- Every (epoch length, bands, model) combination is scored, or --n-iter of
+  them picked at random, across a process pool.
+
+Writes cv_results.csv (best first) and refits the best combination on all
+data into the best_bundle model bundle, like s52/s53 do.
+"""
+
+# 'Filtered Channel 2' and 'Filtered Channel 4', like s52/s53 and the live LDA
+feature_cols = ['Filtered Channel 2', 'Filtered Channel 4']
+
+SEARCH_SPACE = {
+    'epoch_length': [1.0, 2.0, 3.0],
+    'bands': {
+        'all': list(DEFAULT_BANDS),
+        'none': [],
+        'alpha_beta': ['alpha', 'beta'],
+        'slow': ['delta', 'theta', 'alpha'],
+    },
+    'model': [
+        ('lda', {'solver': 'svd'}),
+        ('lda', {'solver': 'lsqr', 'shrinkage': 'auto'}),
+        ('svm', {'C': 0.1}),
+        ('svm', {'C': 1.0}),
+        ('svm', {'C': 10.0}),
+    ],
+}
+
+
+def build_model(name, params):
+    if name == 'lda':
+        return LinearDiscriminantAnalysis(**params)
+    if name == 'svm':
+        return make_pipeline(StandardScaler(), LinearSVC(**params))  # the linear SVM path s53 uses
+    raise ValueError(f"Unknown model {name}")
+
+
+def config_for_bands(bands):
+    return dict(DEFAULT_CONFIG, bands={band: DEFAULT_BANDS[band] for band in bands})
+
+
+def evaluate(task):
+    """Worker: grouped k-fold accuracy of one combination on the memory-mapped feature matrix."""
+    features = np.load(task['feature_path'], mmap_mode='r')
+    X = features[:, task['columns']]  # only the selected columns are read into this process
+    y, groups = task['y'], task['groups']
+    scores = []
+    start = time.perf_counter()
+    for train, test in GroupKFold(n_splits=task['folds']).split(X, y, groups):
+        model = build_model(task['model'], task['params'])
+        model.fit(X[train], y[train])
+        scores.append(np.mean(model.predict(X[test]) == y[test]))
+    return {
+        'epoch_length': task['epoch_length'],
+        'bands': task['bands'],
+        'model': task['model'],
+        'params': task['params'],
+        'mean_accuracy': float(np.mean(scores)),
+        'std_accuracy': float(np.std(scores)),
+        'fold_accuracies': ' '.join(f"{score:.3f}" for score in scores),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def epoch_groups(sessions, n_samples, starts, folds):
+    """Session of every epoch, or contiguous time blocks when s2's catalog isn't there."""
+    if sessions is not None and len(np.unique(sessions[starts])) >= 2:
+        return sessions[starts]
+    print(f"No session catalog with 2+ sessions, grouping folds by {folds} contiguous time blocks")
+    return np.minimum(starts * folds // n_samples, folds - 1)
+
+
+def prepare_epoch_length(epoch_length, signal, label_codes, label_names, runs, sessions, fs, folds):
+    """Features (cached, all columns) and per-epoch labels and groups for one epoch length."""
+    samples_per_epoch = int(epoch_length * fs)
+    starts, window_codes = window_starts(label_codes, samples_per_epoch, samples_per_epoch, runs)
+    print(f"{epoch_length} s epochs: {len(starts)} ({describe(window_codes, label_names)})")
+    features = cached_features(signal, starts, samples_per_epoch, fs, DEFAULT_CONFIG, mmap_mode='r')
+    groups = epoch_groups(sessions, len(signal), starts, folds)
+    return {
+        'feature_path': os.path.abspath(features.filename),
+        'y': window_codes,
+        'groups': groups,
+        'folds': min(folds, len(np.unique(groups))),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grouped cross-validation search over epoch length, bands and model")
+    parser.add_argument("--input", default='filtered_eeg_action_data.csv', help="filtered CSV from s3")
+    parser.add_argument("--folds", type=int, default=5, help="number of grouped folds")
+    parser.add_argument("--n-iter", type=int, default=None, help="score this many random combinations instead of all")
+    parser.add_argument("--seed", type=int, default=42, help="random seed for --n-iter")
+    parser.add_argument("--workers", type=int, default=None, help="processes to use (default: one per core)")
+    parser.add_argument("--results", default='cv_results.csv', help="where to write the results table")
+    parser.add_argument("--output", default='best_bundle', help="model bundle directory for the refitted best model")
+    args = parser.parse_args()
+
+    signal, label_codes, label_names, segments, fs = load_signal(args.input, feature_cols)
+    sessions = session_ids(pd.read_csv(args.input, usecols=['Time'])['Time'].to_numpy())
+    if sessions is None:
+        print("No s2 catalog matching this file, sessions can't be told apart")
+    # sessions also split label runs, so no epoch straddles two sessions
+    runs = segments
+    if sessions is not None:
+        runs = sessions if segments is None else segments * (sessions.max() + 1) + sessions
+
+    combinations = list(itertools.product(SEARCH_SPACE['epoch_length'], SEARCH_SPACE['bands'], SEARCH_SPACE['model']))
+    if args.n_iter and args.n_iter < len(combinations):
+        combinations = random.Random(args.seed).sample(combinations, args.n_iter)
+    print(f"Scoring {len(combinations)} combinations with {args.folds}-fold grouped CV")
+
+    # Features once per epoch length, every combination reuses them
+    prepared = {length: prepare_epoch_length(length, signal, label_codes, label_names, runs, sessions, fs, args.folds)
+                for length in sorted({length for length, _, _ in combinations})}
+    all_names = feature_names(feature_cols, DEFAULT_CONFIG)
+
+    tasks = []
+    for epoch_length, bands, (model, params) in combinations:
+        names = feature_names(feature_cols, config_for_bands(SEARCH_SPACE['bands'][bands]))
+        tasks.append(dict(prepared[epoch_length], epoch_length=epoch_length, bands=bands, model=model,
+                          params=params, columns=[all_names.index(name) for name in names]))
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(evaluate, tasks))
+
+    table = pd.DataFrame(results).sort_values('mean_accuracy', ascending=False, kind='stable')
+    table.to_csv(args.results, index=False)
+    print(table[['epoch_length', 'bands', 'model', 'params', 'mean_accuracy', 'std_accuracy']].head(10).to_string(index=False))
+    print(f"Results saved to '{args.results}'")
+
+    # Refit the best combination on every epoch and save it as a bundle like s52/s53 do
+    task = tasks[int(np.argmax([result['mean_accuracy'] for result in results]))]
+    best = table.iloc[0]  # the same combination, the table sort is stable
+    X = np.load(task['feature_path'], mmap_mode='r')[:, task['columns']]
+    le = LabelEncoder().fit(label_names[task['y']])
+    model = build_model(task['model'], task['params']).fit(X, le.transform(label_names[task['y']]))
+    save_bundle(args.output, model, le.classes_, feature_cols, fs, best['epoch_length'], best['epoch_length'],
+                read_preprocessing(args.input), config_for_bands(SEARCH_SPACE['bands'][best['bands']]),
+                extra={'cv_accuracy': float(best['mean_accuracy'])})
+    print(f"Best: {best['model']} {best['params']}, {best['epoch_length']} s epochs, bands '{best['bands']}', "
+          f"accuracy {best['mean_accuracy']:.2f} +/- {best['std_accuracy']:.2f}. Saved to '{args.output}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,69 +1,56 @@
-import pandas as pd
+import argparse
+import time
 import numpy as np
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Conv2D, SeparableConv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization
-from tensorflow.keras.utils import to_categorical
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import ReduceLROnPlateau
 from sklearn.model_selection import train_test_split
+from eeg_epoching import load_signal, window_starts, run_bounds, cached_signal, describe
+from eeg_inference import TFLiteModel
+from eeg_bundle import save_bundle, read_preprocessing
+
+parser = argparse.ArgumentParser(description="Train the CNN on filtered EEG epochs")
+parser.add_argument("--batch-size", type=int, default=8, help="epochs per training batch")
+parser.add_argument("--max-shift", type=float, default=0.25,
+                    help="time shift augmentation: move training windows up to this many seconds, 0 to disable")
+parser.add_argument("--jitter", type=float, default=0.05,
+                    help="amplitude jitter augmentation: std of the random per-channel gain, 0 to disable")
+parser.add_argument("--no-augment", action="store_true", help="train on the windows exactly as cut")
+parser.add_argument("--quantize", action="store_true",
+                    help="export an int8-quantized TFLite model, calibrated on training windows, instead of float32")
+parser.add_argument("--calibration-windows", type=int, default=200, help="training windows used to calibrate --quantize")
+args = parser.parse_args()
 
 # -----------------------
 # 1. Data Preprocessing & Epoching
 # -----------------------
 
-# Load the CSV file
-df = pd.read_csv('filtered_eeg_action_data.csv')
+# Load every filtered EEG channel as one (samples, channels) array
+channel_cols = ['Filtered Channel 1', 'Filtered Channel 2', 'Filtered Channel 3', 'Filtered Channel 4']
+signal, label_codes, label_names, segments, fs = load_signal('filtered_eeg_action_data.csv', channel_cols)
 
-# Rebase time so that the first time stamp is zero.
-df['Time_Relative'] = df['Time'] - df['Time'].min()
-
-# Define the desired epoch length (in seconds)
+# Define the desired epoch length and the step between epoch starts (in seconds)
 epoch_length = 3.0
+epoch_hop = 3.0  # lower it for overlapping epochs (more training windows)
+samples_per_epoch = int(epoch_length * fs)  # fs is the rate s3 resampled the data to
+samples_per_hop = int(epoch_hop * fs)
 
-# Create an epoch index by doing floor division on the relative time
-df['Epoch_Index'] = (df['Time_Relative'] // epoch_length).astype(int)
-
-# Group the data by epoch index
-epochs = df.groupby('Epoch_Index')
-
-# Collect epochs where the label remains consistent
-consistent_epochs = []
-for epoch_idx, group in epochs:
-    unique_labels = group['Label'].unique()
-    if len(unique_labels) == 1:
-        consistent_epochs.append(group)
-    else:
-        print(f"Epoch {epoch_idx} discarded: multiple labels found {unique_labels}")
-
-print(f"Collected {len(consistent_epochs)} consistent epochs.")
+# Collect epochs where the label remains consistent: windows are laid inside each run of one label
+# within one gap-free segment from s3, so every epoch has exactly samples_per_epoch samples
+starts, window_codes = window_starts(label_codes, samples_per_epoch, samples_per_hop, segments)
+print(f"Collected {len(starts)} consistent epochs ({describe(window_codes, label_names)}).")
 
 # -----------------------
 # 2. Prepare Data for the CNN
 # -----------------------
 
-# Convert EEG data into a 2D format (time x channels)
-X_list = []
-y = []
-for epoch in consistent_epochs:
-    # Extract all available EEG channels as features (assuming they are labeled in the dataset)
-    channel_cols = [col for col in df.columns if 'Filtered Channel' in col]
-    epoch_data = epoch[channel_cols].values
-    X_list.append(epoch_data)
-    y.append(epoch['Label'].iloc[0])
-
-# Determine the minimum number of samples across all epochs
-min_samples = min(epoch.shape[0] for epoch in X_list)
-print("Minimum samples per epoch:", min_samples)
-
-# Truncate each epoch to have the same number of samples
-X_fixed = [epoch[:min_samples] for epoch in X_list]
-
-# Convert list of arrays into a single numpy array
-X = np.array(X_fixed)  # Shape: (num_epochs, min_samples, num_channels)
-y = np.array(y)
-
-print("Shape of X (epochs):", X.shape)  # Expected: (num_epochs, time_samples, num_channels)
+# The windows are never materialized: the signal is written once to an .npy file and memory-mapped,
+# and the tf.data pipeline below slices each batch of windows (time x channels) from it on the fly
+signal = cached_signal(signal)
+y = label_names[window_codes]
+print("Epochs:", len(starts), "of shape", (samples_per_epoch, signal.shape[1]))  # (time_samples, num_channels)
 print("Unique labels:", np.unique(y))
 
 # Map string labels to integer indices
@@ -75,25 +62,64 @@ print("Label mapping:", label_map)
 unique, counts = np.unique(y_int, return_counts=True)
 print("Class distribution:", dict(zip(unique, counts)))
 
-# Convert labels to one-hot encoding
-y_cat = to_categorical(y_int, num_classes=num_classes)
-
-# Reshape X for CNN input (adding an extra channel dimension for Conv2D)
-X = X.reshape(X.shape[0], X.shape[1], X.shape[2], 1)  # Shape: (num_epochs, time_samples, num_channels, 1)
-
-# Split the data into training and testing sets
-X_train, X_test, y_train, y_test = train_test_split(X, y_cat, test_size=0.2, random_state=42)
+# Time shift augmentation may move a window anywhere inside its own label run (and segment)
+run_start, run_end = run_bounds(label_codes, starts, segments)
+max_shift = int(args.max_shift * fs)
+shift_low = np.maximum(starts - max_shift, run_start)
+shift_high = np.minimum(starts + max_shift, run_end - samples_per_epoch)
+
+# Split the epochs into training and testing sets (by index, the data stays on disk)
+train_idx, test_idx = train_test_split(np.arange(len(starts)), test_size=0.2, random_state=42)
+
+offsets = np.arange(samples_per_epoch)
+one_hot = np.eye(num_classes, dtype=np.float32)
+
+
+def load_batch(indices, augment):
+    """Slice a batch of windows from the memory-mapped signal, (batch, time_samples, num_channels, 1)."""
+    batch_starts = starts[indices]
+    rng = np.random.default_rng()
+    if augment and max_shift:
+        # time shift: start each window up to max_shift samples earlier or later, within its label run
+        batch_starts = rng.integers(shift_low[indices], shift_high[indices] + 1)
+    batch = np.asarray(signal[batch_starts[:, np.newaxis] + offsets], dtype=np.float32)
+    if augment and args.jitter:
+        # amplitude jitter: scale every channel of every window by a random gain around 1
+        batch *= rng.normal(1.0, args.jitter, size=(len(batch), 1, batch.shape[2])).astype(np.float32)
+    return batch[..., np.newaxis], one_hot[y_int[indices]]
+
+
+def window_dataset(indices, shuffle, augment):
+    """
+    tf.data pipeline over epoch indices: shuffle, batch, then load each batch in a
+    worker thread (numpy_function) and prefetch so slicing overlaps with training.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        dataset = dataset.shuffle(len(indices), reshuffle_each_iteration=True)
+    dataset = dataset.batch(args.batch_size)
+    dataset = dataset.map(
+        lambda batch: tf.numpy_function(lambda i: load_batch(i, augment), [batch], [tf.float32, tf.float32]),
+        num_parallel_calls=tf.data.AUTOTUNE)
+    # numpy_function loses the shapes, Keras needs them back
+    dataset = dataset.map(lambda x, y: (tf.ensure_shape(x, [None, samples_per_epoch, signal.shape[1], 1]),
+                                        tf.ensure_shape(y, [None, num_classes])))
+    return dataset.prefetch(tf.data.AUTOTUNE)
+
+
+train_dataset = window_dataset(train_idx, shuffle=True, augment=not args.no_augment)
+test_dataset = window_dataset(test_idx, shuffle=False, augment=False)
 
 # -----------------------
 # 3. Build the CNN (Following the Paper's Approach)
 # -----------------------
 
-input_shape = X_train.shape[1:]  # (time_samples, num_channels, 1)
+input_shape = (samples_per_epoch, signal.shape[1], 1)  # (time_samples, num_channels, 1)
 
 model = Sequential()
 
 # First Layer (Spatial feature extraction)
-model.add(Conv2D(filters=8, kernel_size=(3, X.shape[2]), activation='relu', input_shape=input_shape, padding='valid'))
+model.add(Conv2D(filters=8, kernel_size=(3, signal.shape[1]), activation='relu', input_shape=input_shape, padding='valid'))
 model.add(BatchNormalization())
 
 # Second Layer (Temporal feature extraction)
@@ -115,13 +141,61 @@ model.add(Dense(num_classes, activation='softmax'))
 model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=0.0005), loss='categorical_crossentropy', metrics=['accuracy'])
 
 # Train with a Learning Rate Scheduler
-history = model.fit(X_train, y_train, epochs=50, batch_size=8, validation_data=(X_test, y_test), callbacks=[ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, verbose=1)])
+history = model.fit(train_dataset, epochs=50, validation_data=test_dataset, callbacks=[ReduceLROnPlateau(monitor='val_loss', factor=0.5, patience=3, verbose=1)])
 
 # Evaluate Model
-loss, accuracy = model.evaluate(X_test, y_test)
+loss, accuracy = model.evaluate(test_dataset)
 print("Test loss:", loss)
 print("Test accuracy:", accuracy)
 
-model.save('EEG_CNN_model.h5')
-print("Model saved as 'EEG_CNN_model.h5'")
-
+# -----------------------
+# 4. Export for Lightweight Live Inference
+# -----------------------
+# The live script can run a .tflite file through the small tflite_runtime interpreter (eeg_inference.py)
+# instead of importing TensorFlow and calling model.predict() on one window at a time.
+converter = tf.lite.TFLiteConverter.from_keras_model(model)
+if args.quantize:
+    # Post-training int8 quantization: activations are calibrated on real (unaugmented) training windows
+    def representative_dataset():
+        for index in train_idx[:args.calibration_windows]:
+            yield [load_batch(np.array([index]), augment=False)[0]]
+
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    converter.inference_input_type = tf.int8
+    converter.inference_output_type = tf.int8
+tflite_model = converter.convert()
+print(f"Converted to an {'int8' if args.quantize else 'float32'} TFLite model")
+
+# Save the Keras model, the TFLite export and everything the live script needs (label order, channels,
+# epoch length, filter settings) as a model bundle
+save_bundle('cnn_bundle', model, list(label_map), channel_cols, fs, epoch_length, epoch_hop,
+            read_preprocessing('filtered_eeg_action_data.csv'), tflite_model=tflite_model,
+            extra={'quantized': args.quantize})
+tflite_path = 'cnn_bundle/model.tflite'
+
+# Accuracy change from the export, on the same test windows
+lite_model = TFLiteModel(tflite_path)
+keras_pred, lite_pred, true_labels = [], [], []
+for i in range(0, len(test_idx), 256):
+    test_windows, test_labels = load_batch(test_idx[i:i + 256], augment=False)
+    keras_pred.extend(np.argmax(model.predict(test_windows, verbose=0), axis=1))
+    lite_pred.extend(np.argmax(lite_model.predict(test_windows), axis=1))
+    true_labels.extend(np.argmax(test_labels, axis=1))
+keras_pred, lite_pred, true_labels = np.array(keras_pred), np.array(lite_pred), np.array(true_labels)
+keras_accuracy = np.mean(keras_pred == true_labels)
+lite_accuracy = np.mean(lite_pred == true_labels)
+print(f"Keras accuracy {keras_accuracy:.3f}, TFLite accuracy {lite_accuracy:.3f} ({lite_accuracy - keras_accuracy:+.3f}), "
+      f"predictions agree on {np.mean(lite_pred == keras_pred):.1%}")
+
+# Per-inference latency on a single window, the way the live script calls it
+window = load_batch(test_idx[:1], augment=False)[0]
+for name, predict in [('Keras model.predict', lambda: model.predict(window, verbose=0)),
+                      ('TFLite invoke', lambda: lite_model.predict(window))]:
+    predict()  # warm up
+    repeats = 50
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict()
+    print(f"{name}: {(time.perf_counter() - start) / repeats * 1000:.2f} ms per window")
@@ -0,0 +1,57 @@
+import argparse
+from brainflow.board_shim import BoardShim
+from eeg_acquisition import create_board
+from eeg_bundle import bundle_available, load_bundle
+from eeg_ensemble import EnsembleClassifier
+from eeg_live import add_live_arguments, run_live
+
+# The LDA (s52), SVM (s53) and CNN (s5) bundles classify the same windows in one process: one acquisition,
+# one bandpass per distinct filter setting, and the models in parallel on every window (see eeg_ensemble.py).
+# Their outputs are combined by label name, so the bundles don't need the same label order.
+# Without --bundles, the default ones that have been trained (or converted from old model files) are used.
+default_bundles = ['lda_bundle', 'svm_bundle', 'cnn_bundle']
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live classification with an ensemble of model bundles")
+    parser.add_argument("--bundles", nargs='+', default=None,
+                        help=f"model bundles from s5/s52/s53/s54 (default: whichever of {', '.join(default_bundles)} exist)")
+    parser.add_argument("--weights", nargs='+', type=float, default=None, help="one vote weight per bundle (default: equal)")
+    parser.add_argument("--voting", choices=['soft', 'hard'], default='soft',
+                        help="soft: weighted mean of probabilities, hard: weighted vote of each model's top label")
+    parser.add_argument("--keras", action="store_true", help="run full Keras models even if a bundle has a TFLite export")
+    add_live_arguments(parser)
+    args = parser.parse_args()
+    if args.bundles is None:
+        args.bundles = [path for path in default_bundles if bundle_available(path)]
+        if not args.bundles:
+            parser.error(f"none of {', '.join(default_bundles)} exist, train one or give --bundles")
+    if args.weights is not None and len(args.weights) != len(args.bundles):
+        parser.error(f"--weights needs one weight per bundle ({len(args.bundles)})")
+
+    # Loads every model and runs one warm-up prediction each
+    bundles = [load_bundle(path, prefer_tflite=not args.keras) for path in args.bundles]
+
+    board, board_id = create_board(synthetic=args.synthetic, replay=args.replay, speed=args.speed)
+    fs = BoardShim.get_sampling_rate(board_id)
+    # before run_live opens the session, so a refused bundle leaves no board streaming
+    for bundle in bundles:
+        bundle.check_board(fs)
+    # windows and hops are counted at the bundles' fs (EnsembleClassifier checks they share one)
+    samples_per_epoch = max(bundle.window_samples for bundle in bundles)
+    hop_samples = max(1, int(round(args.hop * bundles[0].fs)))
+
+    classifier = EnsembleClassifier(bundles, board_id, hop_samples, args.weights, args.voting)
+
+    print(f"Starting live classification with {', '.join(args.bundles)} ({args.voting} voting), "
+          f"a decision every {args.hop} s. Press Ctrl+C to stop.")
+    try:
+        run_live(board, classifier, args, samples_per_epoch, bundles[0].fs)
+    finally:
+        classifier.close()
+    print("Ensemble members:")
+    classifier.print_member_latency()
+
+
+if __name__ == "__main__":
+    main()